@@ -1,15 +1,19 @@
 from __future__ import annotations
 import json
-import os
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 from typing import Any, Dict, Optional
-from openai import OpenAI
+from agt.llm import DEFAULT_OPENAI_MODEL, LLMBackend, get_backend
+from agt.llm_cache import lookup_response, store_response
+from agt.metrics import track_run
+from agt.prompt import assemble_prompt
 from agt.tools import (
     tool_get_ticket_context,
     tool_rag_search,
     tool_create_ticket_event,
+    timed,
 )
-from db.logging import create_agent_run, log_tool_call, update_agent_run
+from db.logging import FLUSH_TIMEOUT_S, create_agent_run, flush_traces, log_tool_call, update_agent_run
 
 SYSTEM_INSTRUCTIONS = """You are OpsCopilot, an internal support operations agent.
 You MUST:
@@ -35,58 +39,93 @@ Output MUST be valid JSON with this schema:
 class AgentResult:
     agent_run_id: int
     result: Dict[str, Any]
+    timings: Dict[str, float] = field(default_factory=dict)
 
-def _client() -> OpenAI:
-    return OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+def _backend() -> LLMBackend:
+    return get_backend("openai")
 
-def run_agent(ticket_id: Optional[int] = None, free_text: Optional[str] = None, model: str = "gpt-5") -> AgentResult:
-    input_text = free_text
-    ctx = {}
-    if ticket_id is not None:
-        ctx = tool_get_ticket_context(ticket_id)
-        input_text = (ctx["ticket"].get("body") or "").strip()
+def run_agent(ticket_id: Optional[int] = None, free_text: Optional[str] = None, model: str = DEFAULT_OPENAI_MODEL, use_cache: bool = True) -> AgentResult:
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+    with track_run("agent", timings):
+        input_text = free_text
+        ctx = {}
+        if ticket_id is not None:
+            ctx = timed(timings, "context", tool_get_ticket_context, ticket_id)
+            input_text = (ctx["ticket"].get("body") or "").strip()
 
-    agent_run_id = create_agent_run(ticket_id, input_text or "")
+        agent_run_id = create_agent_run(ticket_id, input_text or "")
 
-    if ticket_id is not None:
-        log_tool_call(agent_run_id, "get_ticket_context", {"ticket_id": ticket_id}, ctx)
+        if ticket_id is not None:
+            log_tool_call(agent_run_id, "get_ticket_context", {"ticket_id": ticket_id}, ctx, duration_ms=timings["context"])
 
-    rag_query = input_text[:500] if input_text else "support policy question"
-    rag = tool_rag_search(rag_query, k=5)
-    log_tool_call(agent_run_id, "rag_search", {"query": rag_query, "k": 5}, {"hits": rag["hits"]})
+        rag_query = input_text[:500] if input_text else "support policy question"
+        rag = timed(timings, "rag", tool_rag_search, rag_query, k=5)
+        log_tool_call(agent_run_id, "rag_search", {"query": rag_query, "k": 5}, {"hits": rag["hits"]}, duration_ms=timings["rag"])
 
-    prompt = {
-        "ticket_id": ticket_id,
-        "user_issue": input_text,
-        "sql_context": ctx,
-        "policy_context": rag["context_block"],
-        "note": "Use citations from policy_context where relevant.",
-    }
+        base = {
+            "ticket_id": ticket_id,
+            "user_issue": input_text,
+            "note": "Use citations from policy_context where relevant.",
+        }
+        original = {**base, "sql_context": ctx, "policy_context": rag["context_block"]}
+        prompt, stats = timed(timings, "prompt", assemble_prompt, base, ctx, rag["hits"], original)
+        log_tool_call(agent_run_id, "prompt_assembly", {"budget": stats["budget"]}, stats, duration_ms=timings["prompt"])
 
-    client = _client()
-    resp = client.responses.create(
-        model=model,
-        reasoning={"effort": "low"},
-        instructions=SYSTEM_INSTRUCTIONS,
-        input=json.dumps(prompt, ensure_ascii=False),
-    )
-    out_text = resp.output_text.strip()
-    result = json.loads(out_text)
-
-    log_tool_call(agent_run_id, "llm_generate", {"model": model}, {"raw_output": out_text})
-
-    if ticket_id is not None:
-        for a in result.get("recommended_actions", [])[:5]:
-            etype = a.get("type", "OTHER")
-            reason = a.get("reason", "")
-            tool_create_ticket_event(ticket_id, f"AGENT_{etype}", {"reason": reason})
-        log_tool_call(
-            agent_run_id, 
-            "create_ticket_events", 
-            {"ticket_id": ticket_id}, 
-            {"ok": True, "count": len(result.get("recommended_actions", []))}
+        backend = _backend()
+        config = {"reasoning": {"effort": "low"}}
+        t = ctx.get("ticket") or {}
+        look = timed(
+            timings,
+            "cache",
+            lookup_response,
+            f"{backend.name}/{model}",
+            SYSTEM_INSTRUCTIONS,
+            prompt,
+            config,
+            use_cache=use_cache,
+            issue_text=input_text,
+            tier=t.get("customer_tier"),
+            policy_context=prompt["policy_context"],
+            names={"customer_name": t.get("customer_name") or ""},
         )
+        for name, tool_input, tool_output in look.traces:
+            log_tool_call(agent_run_id, name, tool_input, tool_output, duration_ms=timings["cache"])
+        if not look.reused:
+            usage: Dict[str, int] = {}
+            out_text = timed(
+                timings,
+                "llm",
+                backend.generate,
+                model,
+                json.dumps(prompt, ensure_ascii=False),
+                system=SYSTEM_INSTRUCTIONS,
+                config=config,
+                usage=usage,
+            )
+            result = json.loads(out_text)
+            log_tool_call(agent_run_id, "llm_generate", {"model": model}, {"raw_output": out_text}, duration_ms=timings["llm"], usage=usage)
+            store_response(look, agent_run_id, model, out_text)
+        else:
+            out_text = look.out_text
+            result = json.loads(out_text)
+
+        if ticket_id is not None:
+            t_events = time.perf_counter()
+            for a in result.get("recommended_actions", [])[:5]:
+                etype = a.get("type", "OTHER")
+                reason = a.get("reason", "")
+                tool_create_ticket_event(ticket_id, f"AGENT_{etype}", {"reason": reason})
+            log_tool_call(
+                agent_run_id, 
+                "create_ticket_events", 
+                {"ticket_id": ticket_id}, 
+                {"ok": True, "count": len(result.get("recommended_actions", []))},
+                duration_ms=(time.perf_counter() - t_events) * 1000,
+            )
 
-    update_agent_run(agent_run_id, result.get("customer_reply", out_text))
+        update_agent_run(agent_run_id, result.get("customer_reply", out_text))
+        flush_traces(FLUSH_TIMEOUT_S)
+        timings["total"] = (time.perf_counter() - t0) * 1000
 
-    return AgentResult(agent_run_id=agent_run_id, result=result)
\ No newline at end of file
+    return AgentResult(agent_run_id=agent_run_id, result=result, timings=timings)
\ No newline at end of file
@@ -1,15 +1,24 @@
 from __future__ import annotations
+import asyncio
 import json
 import os
-from dataclasses import dataclass
-from typing import Any, Dict, Optional
-from google import genai
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+from agt.json_stream import JSONFieldStream
+from agt.llm import DEFAULT_GEMINI_MODEL, LLMBackend, get_backend
+from agt.llm_cache import CacheLookup, lookup_response, store_response
+from agt.metrics import track_run
+from agt.prompt import assemble_prompt
 from agt.tools import (
     tool_get_ticket_context,
     tool_rag_search,
     tool_create_ticket_event,
+    timed,
 )
-from db.logging import create_agent_run, log_tool_call, update_agent_run
+from db.sql_tool import cached_ticket_context, get_ticket
+from db.logging import FLUSH_TIMEOUT_S, create_agent_run, flush_traces, log_tool_call, update_agent_run
 
 SYSTEM_INSTRUCTIONS = """You are OpsCopilot, an internal support operations agent.
 You MUST:
@@ -40,100 +49,142 @@ Output MUST be valid JSON with this schema:
 class AgentResult:
     agent_run_id: int
     result: Dict[str, Any]
+    timings: Dict[str, float] = field(default_factory=dict)
 
-def _gemini_client() -> genai.Client:
-    return genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+def _backend() -> LLMBackend:
+    return get_backend("gemini")
 
-def run_agent(
-    ticket_id: Optional[int] = None,
-    free_text: Optional[str] = None,
-    model: str = "gemini-1.5-flash",
-) -> AgentResult:
-    input_text = free_text
-    ctx = {}
-    if ticket_id is not None:
-        ctx = tool_get_ticket_context(ticket_id)
-        input_text = (ctx["ticket"].get("body") or "").strip()
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "required": ["customer_reply", "recommended_actions", "citations", "risk_notes"],
+    "properties": {
+        "customer_reply": {"type": "string"},
+        "recommended_actions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["type", "reason"],
+                "properties": {
+                    "type": {"type": "string"},
+                    "reason": {"type": "string"},
+                },
+            },
+        },
+        "citations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["source", "used_for"],
+                "properties": {
+                    "source": {"type": "string"},
+                    "used_for": {"type": "string"},
+                },
+            },
+        },
+        "risk_notes": {"type": "array", "items": {"type": "string"}},
+    },
+}
 
-    agent_run_id = create_agent_run(ticket_id, input_text or "")
+# Encoding and FAISS search are CPU-bound; keep them off the event loop and the default I/O pool.
+_CPU_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="agent-cpu")
 
-    if ticket_id is not None:
-        log_tool_call(agent_run_id, "get_ticket_context", {"ticket_id": ticket_id}, ctx)
+def _rag_query(input_text: Optional[str]) -> str:
+    return (input_text or "")[:500] if input_text else "support policy question"
 
-    rag_query = (input_text or "")[:500] if input_text else "support policy question"
-    rag = tool_rag_search(rag_query, k=5)
-    log_tool_call(
-        agent_run_id,
-        "rag_search",
-        {"query": rag_query, "k": 5},
-        {"hits": rag.get("hits", []), "context_block": rag.get("context_block", "")},
-    )
-
-    prompt = {
+def _build_prompt(
+    agent_run_id: int,
+    ticket_id: Optional[int],
+    input_text: Optional[str],
+    ctx: Dict[str, Any],
+    rag: Dict[str, Any],
+    timings: Dict[str, float],
+) -> Dict[str, Any]:
+    # The output schema is enforced through response_schema, so it is not repeated in the prompt.
+    base = {
         "system": SYSTEM_INSTRUCTIONS,
         "ticket_id": ticket_id,
         "user_issue": input_text,
-        "sql_context": ctx,
-        "policy_context": rag.get("context_block", ""),
         "note": "Use citations from policy_context (doc#chunk (title)) when relevant.",
-        "required_output_schema": {
-            "customer_reply": "string",
-            "recommended_actions": [{"type": "TAG|ESCALATE|REFUND|REPLACE|REQUEST_INFO|OTHER", "reason": "string"}],
-            "citations": [{"source": "doc#chunk (title)", "used_for": "string"}],
-            "risk_notes": ["string"],
-        },
     }
+    original = {**base, "sql_context": ctx, "policy_context": rag.get("context_block", "")}
+    prompt, stats = timed(timings, "prompt", assemble_prompt, base, ctx, rag.get("hits", []), original)
+    log_tool_call(agent_run_id, "prompt_assembly", {"budget": stats["budget"]}, stats, duration_ms=timings["prompt"])
+    return prompt
 
-    client = _gemini_client()
-    resp = client.models.generate_content(
-        model=model,
-        contents=json.dumps(prompt, ensure_ascii=False),
-        config={
-            "response_mime_type": "application/json",
-            "response_schema": {
-                "type": "object",
-                "required": ["customer_reply", "recommended_actions", "citations", "risk_notes"],
-                "properties": {
-                    "customer_reply": {"type": "string"},
-                    "recommended_actions": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "required": ["type", "reason"],
-                            "properties": {
-                                "type": {"type": "string"},
-                                "reason": {"type": "string"},
-                            },
-                        },
-                    },
-                    "citations": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "required": ["source", "used_for"],
-                            "properties": {
-                                "source": {"type": "string"},
-                                "used_for": {"type": "string"},
-                            },
-                        },
-                    },
-                    "risk_notes": {"type": "array", "items": {"type": "string"}},
-                },
-            },
-        },
-    )
+def _llm_config() -> Dict[str, Any]:
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": RESPONSE_SCHEMA,
+    }
 
-    out_text = (resp.text or "").strip()
-    result = json.loads(out_text)
+def _cache_lookup(
+    model: str,
+    prompt: Dict[str, Any],
+    input_text: Optional[str],
+    ctx: Dict[str, Any],
+    use_cache: bool,
+) -> CacheLookup:
+    t = ctx.get("ticket") or {}
+    return lookup_response(
+        model,
+        SYSTEM_INSTRUCTIONS,
+        prompt,
+        _llm_config(),
+        use_cache=use_cache,
+        issue_text=input_text,
+        tier=t.get("customer_tier"),
+        policy_context=prompt["policy_context"],
+        names={"customer_name": t.get("customer_name") or ""},
+    )
 
+def _log_context(
+    agent_run_id: int,
+    ticket_id: Optional[int],
+    ctx: Dict[str, Any],
+    rag_query: str,
+    rag: Dict[str, Any],
+    timings: Dict[str, float],
+) -> None:
+    if ticket_id is not None:
+        # No duration when the context came from the in-process cache.
+        log_tool_call(agent_run_id, "get_ticket_context", {"ticket_id": ticket_id}, ctx, duration_ms=timings.get("context"))
     log_tool_call(
         agent_run_id,
-        "llm_generate",
-        {"model": model, "prompt": prompt},
-        {"raw_output": out_text},
+        "rag_search",
+        {"query": rag_query, "k": 5},
+        {"hits": rag.get("hits", []), "context_block": rag.get("context_block", "")},
+        duration_ms=timings.get("rag"),
     )
 
+def _finish(
+    agent_run_id: int,
+    ticket_id: Optional[int],
+    model: str,
+    prompt: Dict[str, Any],
+    out_text: str,
+    timings: Optional[Dict[str, float]] = None,
+    look: Optional[CacheLookup] = None,
+    usage: Optional[Dict[str, int]] = None,
+) -> AgentResult:
+    timings = timings if timings is not None else {}
+    result = json.loads(out_text)
+
+    for name, tool_input, tool_output in (look.traces if look else []):
+        log_tool_call(agent_run_id, name, tool_input, tool_output, duration_ms=timings.get("cache"))
+    if look is None or not look.reused:
+        log_tool_call(
+            agent_run_id,
+            "llm_generate",
+            {"model": model, "prompt": prompt},
+            {"raw_output": out_text},
+            duration_ms=timings.get("llm"),
+            usage=usage,
+        )
+        if look is not None:
+            store_response(look, agent_run_id, model, out_text)
+
     if ticket_id is not None:
+        t_events = time.perf_counter()
         actions = result.get("recommended_actions", []) or []
         for a in actions[:5]:
             etype = (a.get("type") or "OTHER").strip()
@@ -145,8 +196,210 @@ def run_agent(
             "create_ticket_events",
             {"ticket_id": ticket_id},
             {"ok": True, "count": len(actions)},
+            duration_ms=(time.perf_counter() - t_events) * 1000,
         )
 
     update_agent_run(agent_run_id, result.get("customer_reply", out_text))
+    flush_traces(FLUSH_TIMEOUT_S)
+
+    return AgentResult(agent_run_id=agent_run_id, result=result, timings=timings)
+
+def run_agent(
+    ticket_id: Optional[int] = None,
+    free_text: Optional[str] = None,
+    model: str = DEFAULT_GEMINI_MODEL,
+    use_cache: bool = True,
+) -> AgentResult:
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+    with track_run("agent1", timings):
+        input_text = free_text
+        ctx = {}
+        if ticket_id is not None:
+            ctx = timed(timings, "context", tool_get_ticket_context, ticket_id)
+            input_text = (ctx["ticket"].get("body") or "").strip()
+
+        agent_run_id = create_agent_run(ticket_id, input_text or "")
+
+        rag_query = _rag_query(input_text)
+        rag = timed(timings, "rag", tool_rag_search, rag_query, k=5)
+        _log_context(agent_run_id, ticket_id, ctx, rag_query, rag, timings)
 
-    return AgentResult(agent_run_id=agent_run_id, result=result)
\ No newline at end of file
+        prompt = _build_prompt(agent_run_id, ticket_id, input_text, ctx, rag, timings)
+
+        backend = _backend()
+        look = timed(timings, "cache", _cache_lookup, f"{backend.name}/{model}", prompt, input_text, ctx, use_cache)
+        usage: Dict[str, int] = {}
+        if not look.reused:
+            out_text = timed(
+                timings,
+                "llm",
+                backend.generate,
+                model,
+                json.dumps(prompt, ensure_ascii=False),
+                config=_llm_config(),
+                usage=usage,
+            )
+        else:
+            out_text = look.out_text
+
+        res = timed(timings, "finish", _finish, agent_run_id, ticket_id, model, prompt, out_text, timings, look, usage)
+        timings["total"] = (time.perf_counter() - t0) * 1000
+    return res
+
+StageCallback = Callable[[str, Dict[str, Any]], None]
+
+async def _notify(stage: str, aw: Awaitable[Any], on_stage: Optional[StageCallback], summary: Callable[[Any], Dict[str, Any]]) -> Any:
+    res = await aw
+    if on_stage is not None:
+        on_stage(stage, summary(res))
+    return res
+
+async def _prepare_async(
+    ticket_id: Optional[int],
+    free_text: Optional[str],
+    timings: Dict[str, float],
+    on_stage: Optional[StageCallback] = None,
+) -> Tuple[int, Optional[str], Dict[str, Any], Dict[str, Any]]:
+    """Load SQL context, run RAG retrieval and open the agent run concurrently; returns (run id, issue, ctx, rag)."""
+    loop = asyncio.get_running_loop()
+    input_text = free_text
+    ctx: Optional[Dict[str, Any]] = {}
+    if ticket_id is not None:
+        ctx = cached_ticket_context(ticket_id)
+        if ctx is None:
+            # Only the body is needed to start retrieval; the rest of the context loads alongside it.
+            t = await asyncio.to_thread(get_ticket, ticket_id)
+        else:
+            t = ctx["ticket"]
+        input_text = (t.get("body") or "").strip()
+
+    rag_query = _rag_query(input_text)
+    rag_fut = _notify(
+        "rag",
+        loop.run_in_executor(_CPU_POOL, timed, timings, "rag", tool_rag_search, rag_query, 5),
+        on_stage,
+        lambda r: {"hits": [{"cite": h["cite"], "score": h["score"]} for h in r.get("hits", [])]},
+    )
+    run_fut = _notify(
+        "agent_run",
+        asyncio.to_thread(create_agent_run, ticket_id, input_text or ""),
+        on_stage,
+        lambda run_id: {"agent_run_id": run_id},
+    )
+    if ctx is None:
+        ctx_fut = asyncio.to_thread(timed, timings, "context", tool_get_ticket_context, ticket_id)
+    else:
+        ctx_fut = asyncio.sleep(0, ctx)
+    ctx, rag, agent_run_id = await asyncio.gather(
+        _notify("context", ctx_fut, on_stage, _context_summary) if ticket_id is not None else ctx_fut,
+        rag_fut,
+        run_fut,
+    )
+    # Payload encoding (zlib + sha256) and, with TRACE_SYNC=1, a commit: kept off the event loop.
+    await asyncio.to_thread(_log_context, agent_run_id, ticket_id, ctx, rag_query, rag, timings)
+    return agent_run_id, input_text, ctx, rag
+
+def _context_summary(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    t = ctx.get("ticket") or {}
+    return {
+        "ticket_id": t.get("id"),
+        "customer_tier": t.get("customer_tier"),
+        "recent_orders": len(ctx.get("recent_orders") or []),
+        "similar_tickets": len(ctx.get("similar_tickets") or []),
+    }
+
+async def run_agent_async(
+    ticket_id: Optional[int] = None,
+    free_text: Optional[str] = None,
+    model: str = DEFAULT_GEMINI_MODEL,
+    use_cache: bool = True,
+) -> AgentResult:
+    """Same pipeline as run_agent, with SQL context and RAG retrieval running concurrently."""
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+    loop = asyncio.get_running_loop()
+    with track_run("agent1", timings):
+        agent_run_id, input_text, ctx, rag = await _prepare_async(ticket_id, free_text, timings)
+
+        prompt = await asyncio.to_thread(_build_prompt, agent_run_id, ticket_id, input_text, ctx, rag, timings)
+
+        # The semantic tier encodes the issue text, so the lookup runs on the CPU pool like retrieval.
+        backend = _backend()
+        look = await loop.run_in_executor(
+            _CPU_POOL, timed, timings, "cache", _cache_lookup, f"{backend.name}/{model}", prompt, input_text, ctx, use_cache
+        )
+        usage: Dict[str, int] = {}
+        if not look.reused:
+            t_llm = time.perf_counter()
+            out_text = await backend.agenerate(model, json.dumps(prompt, ensure_ascii=False), config=_llm_config(), usage=usage)
+            timings["llm"] = (time.perf_counter() - t_llm) * 1000
+        else:
+            out_text = look.out_text
+
+        res = await asyncio.to_thread(
+            timed, timings, "finish", _finish, agent_run_id, ticket_id, model, prompt, out_text, timings, look, usage
+        )
+        timings["total"] = (time.perf_counter() - t0) * 1000
+    return res
+
+async def run_agent_stream(
+    ticket_id: Optional[int] = None,
+    free_text: Optional[str] = None,
+    model: str = DEFAULT_GEMINI_MODEL,
+    use_cache: bool = True,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Async pipeline yielding (event, data) as stages finish and customer_reply text as it is generated.
+
+    Events: context, rag, agent_run, llm_start, reply_delta, then done with the same
+    agent_run_id/result shape as /run_agent1.
+    """
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+    loop = asyncio.get_running_loop()
+    with track_run("agent1", timings):
+        events: "asyncio.Queue[Tuple[str, Dict[str, Any]]]" = asyncio.Queue()
+        prep = asyncio.ensure_future(
+            _prepare_async(ticket_id, free_text, timings, on_stage=lambda stage, data: events.put_nowait((stage, data)))
+        )
+        try:
+            while not (prep.done() and events.empty()):
+                get = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait({get, prep}, return_when=asyncio.FIRST_COMPLETED)
+                if get in done:
+                    yield get.result()
+                else:
+                    get.cancel()
+        finally:
+            if not prep.done():
+                prep.cancel()
+        agent_run_id, input_text, ctx, rag = prep.result()
+
+        prompt = await asyncio.to_thread(_build_prompt, agent_run_id, ticket_id, input_text, ctx, rag, timings)
+        backend = _backend()
+        look = await loop.run_in_executor(
+            _CPU_POOL, timed, timings, "cache", _cache_lookup, f"{backend.name}/{model}", prompt, input_text, ctx, use_cache
+        )
+        yield "llm_start", {"backend": backend.name, "model": model, "cached": look.reused}
+
+        reply = JSONFieldStream("customer_reply")
+        usage: Dict[str, int] = {}
+        if look.reused:
+            out_text = look.out_text
+            yield "reply_delta", {"text": reply.feed(out_text)}
+        else:
+            t_llm = time.perf_counter()
+            parts = []
+            async for piece in backend.astream(model, json.dumps(prompt, ensure_ascii=False), config=_llm_config(), usage=usage):
+                parts.append(piece)
+                text = reply.feed(piece)
+                if text:
+                    yield "reply_delta", {"text": text}
+            timings["llm"] = (time.perf_counter() - t_llm) * 1000
+            out_text = "".join(parts).strip()
+
+        res = await asyncio.to_thread(
+            timed, timings, "finish", _finish, agent_run_id, ticket_id, model, prompt, out_text, timings, look, usage
+        )
+        timings["total"] = (time.perf_counter() - t0) * 1000
+        yield "done", {"agent_run_id": res.agent_run_id, "result": res.result, "timings": res.timings}
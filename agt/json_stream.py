@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+class JSONFieldStream:
+    """Incrementally decodes one top-level string field of a JSON object that arrives in arbitrary pieces.
+
+    feed() returns the newly decoded characters of that field, so a reply can be shown while the rest
+    of the object (actions, citations, ...) is still being generated.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.value = ""
+        self._depth = 0
+        self._in_str = False
+        self._is_key = False
+        self._expect_key = False
+        self._key = ""
+        self._cur_key = None
+        self._esc = False
+        self._hex = None
+        self._high = None
+
+    def _emitting(self) -> bool:
+        return self._depth == 1 and not self._is_key and self._cur_key == self.field
+
+    def _char(self, c: str, out: list) -> None:
+        if self._is_key:
+            self._key += c
+        elif self._emitting():
+            out.append(c)
+
+    def _code_unit(self, cu: int, out: list) -> None:
+        if 0xD800 <= cu < 0xDC00:
+            self._high = cu
+            return
+        if 0xDC00 <= cu < 0xE000 and self._high is not None:
+            cu = 0x10000 + ((self._high - 0xD800) << 10) + (cu - 0xDC00)
+        self._high = None
+        self._char(chr(cu), out)
+
+    def feed(self, chunk: str) -> str:
+        out: list = []
+        for c in chunk:
+            if self._in_str:
+                if self._hex is not None:
+                    self._hex += c
+                    if len(self._hex) == 4:
+                        self._code_unit(int(self._hex, 16), out)
+                        self._hex = None
+                elif self._esc:
+                    self._esc = False
+                    if c == "u":
+                        self._hex = ""
+                    else:
+                        self._char(ESCAPES.get(c, c), out)
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._is_key:
+                        self._cur_key = self._key
+                        self._is_key = False
+                else:
+                    self._char(c, out)
+            elif c == '"':
+                self._in_str = True
+                self._is_key = self._depth == 1 and self._expect_key
+                if self._is_key:
+                    self._key = ""
+                    self._expect_key = False
+            elif c in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = c == "{"
+            elif c in "}]":
+                self._depth -= 1
+            elif c == "," and self._depth == 1:
+                self._expect_key = True
+                self._cur_key = None
+        text = "".join(out)
+        self.value += text
+        return text
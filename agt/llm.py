@@ -0,0 +1,202 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+from agt.metrics import LLM_TOKENS
+from agt.prompt import count_tokens
+
+Usage = Dict[str, int]
+
+# Default models for the two agents; the API, UI (via the API), scripts and the triage runner all use these.
+DEFAULT_GEMINI_MODEL = "gemini-2.5-flash"
+DEFAULT_OPENAI_MODEL = "gpt-5"
+
+class LLMBackend:
+    """One JSON-producing LLM call; the agents depend only on this interface.
+
+    Callers that want token counts pass a `usage` dict, which is filled with prompt_tokens and
+    completion_tokens when the backend reports them.
+    """
+
+    name = "base"
+
+    def _record_usage(self, usage: Optional[Usage], prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+        for kind, n in (("prompt_tokens", prompt_tokens), ("completion_tokens", completion_tokens)):
+            if n is None:
+                continue
+            LLM_TOKENS.inc(int(n), backend=self.name, kind=kind.split("_")[0])
+            if usage is not None:
+                usage[kind] = int(n)
+
+    def generate(self, model: str, prompt: str, system: Optional[str] = None, config: Optional[Dict[str, Any]] = None, usage: Optional[Usage] = None) -> str:
+        raise NotImplementedError
+
+    async def agenerate(self, model: str, prompt: str, system: Optional[str] = None, config: Optional[Dict[str, Any]] = None, usage: Optional[Usage] = None) -> str:
+        return await asyncio.to_thread(self.generate, model, prompt, system, config, usage)
+
+    async def astream(self, model: str, prompt: str, system: Optional[str] = None, config: Optional[Dict[str, Any]] = None, usage: Optional[Usage] = None) -> AsyncIterator[str]:
+        """Yield the response text in pieces; backends without a streaming API yield it whole."""
+        yield await self.agenerate(model, prompt, system, config, usage)
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self):
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        return self._client
+
+    def _config(self, system: Optional[str], config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        cfg = dict(config or {})
+        if system:
+            cfg["system_instruction"] = system
+        return cfg
+
+    def _usage(self, resp, usage: Optional[Usage]) -> None:
+        meta = getattr(resp, "usage_metadata", None)
+        if meta is not None:
+            self._record_usage(usage, meta.prompt_token_count, meta.candidates_token_count)
+
+    def generate(self, model, prompt, system=None, config=None, usage=None) -> str:
+        resp = self.client().models.generate_content(model=model, contents=prompt, config=self._config(system, config))
+        self._usage(resp, usage)
+        return (resp.text or "").strip()
+
+    async def agenerate(self, model, prompt, system=None, config=None, usage=None) -> str:
+        resp = await self.client().aio.models.generate_content(model=model, contents=prompt, config=self._config(system, config))
+        self._usage(resp, usage)
+        return (resp.text or "").strip()
+
+    async def astream(self, model, prompt, system=None, config=None, usage=None) -> AsyncIterator[str]:
+        stream = await self.client().aio.models.generate_content_stream(
+            model=model, contents=prompt, config=self._config(system, config)
+        )
+        last = None
+        async for chunk in stream:
+            last = chunk
+            if chunk.text:
+                yield chunk.text
+        # Usage metadata is cumulative; the last chunk carries the totals.
+        self._usage(last, usage)
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self):
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        return self._client
+
+    def generate(self, model, prompt, system=None, config=None, usage=None) -> str:
+        resp = self.client().responses.create(model=model, instructions=system, input=prompt, **(config or {}))
+        if resp.usage is not None:
+            self._record_usage(usage, resp.usage.input_tokens, resp.usage.output_tokens)
+        return resp.output_text.strip()
+
+class StubBackendError(RuntimeError):
+    pass
+
+class StubBackend(LLMBackend):
+    """Offline backend: schema-valid JSON derived from the prompt, with simulated latency, jitter and failures."""
+
+    name = "stub"
+
+    def __init__(
+        self,
+        latency_ms: Optional[float] = None,
+        jitter_ms: Optional[float] = None,
+        failure_rate: Optional[float] = None,
+        seed: Optional[int] = None,
+        chunk_chars: int = 16,
+        first_chunk_share: float = 0.3,
+    ):
+        # Unset parameters come from the environment at construction time, so harnesses can set STUB_* after import.
+        env = os.environ
+        self.latency_ms = latency_ms if latency_ms is not None else float(env.get("STUB_LATENCY_MS", 800))
+        self.jitter_ms = jitter_ms if jitter_ms is not None else float(env.get("STUB_JITTER_MS", 200))
+        self.failure_rate = failure_rate if failure_rate is not None else float(env.get("STUB_FAILURE_RATE", 0.0))
+        self.chunk_chars = chunk_chars
+        self.first_chunk_share = first_chunk_share
+        self._rng = random.Random(seed if seed is not None else int(env.get("STUB_SEED", 0)))
+        self._lock = threading.Lock()
+
+    def _draw(self) -> tuple:
+        with self._lock:
+            delay = max(0.0, self._rng.gauss(self.latency_ms, self.jitter_ms)) / 1000 if self.jitter_ms else self.latency_ms / 1000
+            return delay, self._rng.random() < self.failure_rate
+
+    def respond(self, prompt: str) -> str:
+        try:
+            p = json.loads(prompt)
+        except ValueError:
+            p = {}
+        policy = p.get("policy_context") or ""
+        sources = re.findall(r"^\[\d+\] (.+)$", policy, flags=re.M)
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        issue = " ".join(str(p.get("user_issue") or "").split()[:12])
+        return json.dumps({
+            "customer_reply": f"Thanks for reaching out about: {issue}. We are looking into it. (stub {digest})",
+            "recommended_actions": [{"type": "TAG", "reason": "stub backend"}],
+            "citations": [{"source": sources[0], "used_for": "stub backend"}] if sources else [],
+            "risk_notes": [] if policy else ["No policy context retrieved."],
+        })
+
+    def _respond(self, prompt: str, system: Optional[str], usage: Optional[Usage]) -> str:
+        text = self.respond(prompt)
+        self._record_usage(usage, count_tokens((system or "") + prompt), count_tokens(text))
+        return text
+
+    def generate(self, model, prompt, system=None, config=None, usage=None) -> str:
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise StubBackendError("stub backend: simulated failure")
+        return self._respond(prompt, system, usage)
+
+    async def agenerate(self, model, prompt, system=None, config=None, usage=None) -> str:
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        if fail:
+            raise StubBackendError("stub backend: simulated failure")
+        return self._respond(prompt, system, usage)
+
+    async def astream(self, model, prompt, system=None, config=None, usage=None) -> AsyncIterator[str]:
+        # Same total latency as agenerate, split into time-to-first-chunk plus evenly paced chunks.
+        delay, fail = self._draw()
+        await asyncio.sleep(delay * self.first_chunk_share)
+        if fail:
+            raise StubBackendError("stub backend: simulated failure")
+        text = self._respond(prompt, system, usage)
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        pause = delay * (1 - self.first_chunk_share) / max(len(pieces), 1)
+        for piece in pieces:
+            yield piece
+            await asyncio.sleep(pause)
+
+BACKENDS = {"gemini": GeminiBackend, "openai": OpenAIBackend, "stub": StubBackend}
+_instances: Dict[str, LLMBackend] = {}
+_instances_lock = threading.Lock()
+
+def get_backend(default: str) -> LLMBackend:
+    """Backend named by LLM_BACKEND, else the agent's default; one shared instance per name."""
+    name = os.environ.get("LLM_BACKEND", default)
+    if name not in BACKENDS:
+        raise ValueError(f"unknown LLM backend {name!r}; expected one of {sorted(BACKENDS)}")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = BACKENDS[name]()
+        return _instances[name]
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from agt.metrics import CACHE_LOOKUPS
+from db.conn import get_conn, transaction
+
+CACHE_PATH = Path(os.environ.get("LLM_CACHE_PATH", "dat/out/llm_cache.sqlite"))
+CACHE_TTL_S = float(os.environ.get("LLM_CACHE_TTL_S", 7 * 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 10000))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+  key          TEXT PRIMARY KEY,
+  model        TEXT NOT NULL,
+  response     TEXT NOT NULL,
+  created_at   REAL NOT NULL,
+  last_used_at REAL NOT NULL,
+  hits         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used_at);
+"""
+
+def canonical_json(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def prompt_key(model: str, system: str, prompt: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> str:
+    payload = "\0".join((model, system, canonical_json(prompt), canonical_json(config or {})))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """Exact-match store of raw LLM responses keyed by prompt_key, with TTL and LRU size eviction."""
+
+    def __init__(self, path: Path = CACHE_PATH, ttl_s: float = CACHE_TTL_S, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._ready = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_s > 0 and self.max_entries > 0
+
+    def _ensure_schema(self) -> None:
+        if self._ready:
+            return
+        with self._lock:
+            if not self._ready:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with transaction(self.path) as conn:
+                    conn.executescript(SCHEMA)
+                self._ready = True
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return (response, age in seconds) for a live entry, else None."""
+        if not self.enabled:
+            return None
+        self._ensure_schema()
+        now = time.time()
+        row = get_conn(db_path=self.path).execute(
+            "SELECT response, created_at FROM llm_cache WHERE key = ? AND created_at >= ?",
+            (key, now - self.ttl_s),
+        ).fetchone()
+        if row is None:
+            return None
+        with transaction(self.path) as conn:
+            conn.execute("UPDATE llm_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        return row["response"], now - row["created_at"]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        if not self.enabled:
+            return
+        self._ensure_schema()
+        now = time.time()
+        with transaction(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, model, response, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_s,))
+            conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                  SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def stats(self) -> Dict[str, int]:
+        self._ensure_schema()
+        row = get_conn(db_path=self.path).execute(
+            "SELECT COUNT(*) AS size, COALESCE(SUM(hits), 0) AS hits FROM llm_cache"
+        ).fetchone()
+        return {"size": row["size"], "hits": row["hits"]}
+
+    def clear(self) -> None:
+        self._ensure_schema()
+        with transaction(self.path) as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
+
+@dataclass
+class CacheLookup:
+    """Outcome of the cache tiers for one prompt; `traces` are tool_calls rows to log for the run."""
+
+    key: str
+    out_text: Optional[str] = None
+    traces: List[Tuple[str, Dict[str, Any], Dict[str, Any]]] = field(default_factory=list)
+    probe: Any = None
+
+    @property
+    def reused(self) -> bool:
+        return self.out_text is not None
+
+def lookup_response(
+    model: str,
+    system: str,
+    prompt: Dict[str, Any],
+    config: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    issue_text: Optional[str] = None,
+    tier: Optional[str] = None,
+    policy_context: str = "",
+    names: Optional[Dict[str, str]] = None,
+) -> CacheLookup:
+    """Exact prompt match first, then (when SEMANTIC_CACHE=1) a near-duplicate issue in the same tier/policy scope."""
+    look = CacheLookup(key=prompt_key(model, system, prompt, config))
+    hit = get_llm_cache().get(look.key) if use_cache else None
+    if hit is not None:
+        look.out_text, age = hit
+        look.traces.append(("cache_hit", {"model": model, "key": look.key}, {"age_s": round(age, 1), "raw_output": look.out_text}))
+        CACHE_LOOKUPS.inc(result="hit")
+        return look
+    from agt.semantic_cache import SEMANTIC_CACHE_ENABLED, get_semantic_cache
+    if SEMANTIC_CACHE_ENABLED and issue_text:
+        sc = get_semantic_cache()
+        look.probe = sc.probe(issue_text, model, tier, policy_context, names, search=use_cache)
+        sem = look.probe.hit
+        if sem is not None:
+            look.out_text = sem.response
+            look.traces.append((
+                "semantic_cache_hit",
+                {"model": model, "matched_run_id": sem.agent_run_id},
+                {"score": round(sem.score, 4), "threshold": sc.threshold, "replacements": sem.replacements, "raw_output": sem.response},
+            ))
+        elif use_cache:
+            look.traces.append(("semantic_cache_miss", {"model": model}, {"score": round(look.probe.score, 4), "threshold": sc.threshold}))
+    CACHE_LOOKUPS.inc(result="semantic_hit" if look.reused else "miss" if use_cache else "bypass")
+    return look
+
+def store_response(look: CacheLookup, agent_run_id: int, model: str, out_text: str) -> None:
+    get_llm_cache().put(look.key, model, out_text)
+    if look.probe is not None:
+        from agt.semantic_cache import get_semantic_cache
+        get_semantic_cache().add(agent_run_id, look.probe, out_text)
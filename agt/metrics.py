@@ -0,0 +1,172 @@
+from __future__ import annotations
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+def _labels(names: Tuple[str, ...], key: LabelKey, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(head + self.samples())
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_fmt(v)}" for k, v in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS_S):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Per series: one count per bucket (non-cumulative), then sum and count.
+            s = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    s[i] += 1
+                    break
+            s[-2] += value
+            s[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(s)) for k, s in self._series.items())
+        out: List[str] = []
+        for key, s in items:
+            cum = 0.0
+            for i, bound in enumerate(self.buckets):
+                cum += s[i]
+                le = 'le="%s"' % _fmt(bound)
+                out.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {_fmt(cum)}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, key)} {_fmt(s[-2])}")
+            out.append(f"{self.name}_count{_labels(self.label_names, key)} {_fmt(s[-1])}")
+        return out
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS_S) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("agent_stage_seconds", "Wall time of each agent pipeline stage.", ("agent", "stage"))
+RAG_SECONDS = REGISTRY.histogram("rag_search_seconds", "RAG retrieval time split into query encoding and index search.", ("phase",))
+RUNS = REGISTRY.counter("agent_runs_total", "Finished agent runs by outcome (ok, error, cancelled).", ("agent", "outcome"))
+ERRORS = REGISTRY.counter("agent_errors_total", "Failed agent runs by exception type.", ("agent", "error"))
+IN_FLIGHT = REGISTRY.gauge("agent_runs_in_flight", "Agent runs currently executing.", ("agent",))
+CACHE_LOOKUPS = REGISTRY.counter("llm_cache_lookups_total", "LLM response cache lookups by result (hit, semantic_hit, miss, bypass).", ("result",))
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "LLM tokens reported by the backend.", ("backend", "kind"))
+
+@contextmanager
+def track_run(agent: str, timings: Optional[Dict[str, float]] = None) -> Iterator[None]:
+    """Count one agent run as in flight; on exit record its outcome and, on success, its stage timings (ms)."""
+    IN_FLIGHT.inc(agent=agent)
+    outcome = "cancelled"
+    try:
+        yield
+        outcome = "ok"
+        for stage, ms in (timings or {}).items():
+            STAGE_SECONDS.observe(ms / 1000, agent=agent, stage=stage)
+    except Exception as e:
+        outcome = "error"
+        ERRORS.inc(agent=agent, error=type(e).__name__)
+        raise
+    finally:
+        IN_FLIGHT.dec(agent=agent)
+        RUNS.inc(agent=agent, outcome=outcome)
+
+@contextmanager
+def observe_seconds(hist: Histogram, **labels: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        hist.observe(time.perf_counter() - t0, **labels)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import json
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 1800))
+SIMILAR_PREVIEW_CHARS = 120
+OVERLAP_PROBE_CHARS = 40
+OVERLAP_WINDOW_CHARS = 400
+
+TICKET_FIELDS = ("subject", "status", "priority", "category", "created_at", "customer_name", "customer_tier")
+ORDER_FIELDS = ("product_name", "order_status", "total", "created_at")
+SIMILAR_FIELDS = ("id", "subject", "category", "status", "preview")
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(obj: Any) -> int:
+    """Approximate BPE token count (words plus punctuation) of a string or its JSON serialization."""
+    text = obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False)
+    return len(_TOKEN_RE.findall(text))
+
+def _join_overlapping(a: str, b: str) -> str:
+    # Chunks come from rag.chunking.chunk_text, so consecutive chunks repeat the tail of the previous one.
+    probe = b[:OVERLAP_PROBE_CHARS]
+    pos = a.find(probe, max(0, len(a) - OVERLAP_WINDOW_CHARS))
+    if probe and pos >= 0 and b.startswith(a[pos:]):
+        return a[:pos] + b
+    return f"{a} {b}"
+
+def merge_chunks(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge hits on consecutive chunks of the same document into one passage; best passages first."""
+    by_doc: Dict[str, List[Dict[str, Any]]] = {}
+    for h in hits:
+        by_doc.setdefault(h["doc_id"], []).append(h)
+    passages: List[Dict[str, Any]] = []
+    for doc_id, doc_hits in by_doc.items():
+        doc_hits = sorted({h["chunk_id"]: h for h in doc_hits}.values(), key=lambda h: h["chunk_id"])
+        run = [doc_hits[0]]
+        for h in doc_hits[1:] + [None]:
+            if h is not None and h["chunk_id"] == run[-1]["chunk_id"] + 1:
+                run.append(h)
+                continue
+            text = run[0]["text"]
+            for nxt in run[1:]:
+                text = _join_overlapping(text, nxt["text"])
+            first, last = run[0]["chunk_id"], run[-1]["chunk_id"]
+            chunks = f"chunk{first}" if first == last else f"chunk{first}-{last}"
+            passages.append({
+                "cite": f"{doc_id}#{chunks} ({run[0]['doc_title']})",
+                "score": max(x["score"] for x in run),
+                "text": text,
+                "n_chunks": len(run),
+            })
+            run = [h]
+    return sorted(passages, key=lambda p: -p["score"])
+
+def policy_block(passages: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(f"[{i}] {p['cite']}\n{p['text']}" for i, p in enumerate(passages, start=1))
+
+def compact_context(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """SQL context without fields the model does not need (ids, email, the body already sent as user_issue)."""
+    if not ctx:
+        return {}
+    t = ctx.get("ticket") or {}
+    return {
+        "ticket": {k: t[k] for k in TICKET_FIELDS if t.get(k) is not None},
+        "customer_stats": ctx.get("customer_stats") or {},
+        "recent_orders": [{k: o.get(k) for k in ORDER_FIELDS} for o in ctx.get("recent_orders") or []],
+        "similar_tickets": [
+            {k: (s.get(k) or "")[:SIMILAR_PREVIEW_CHARS] if k == "preview" else s.get(k) for k in SIMILAR_FIELDS}
+            for s in ctx.get("similar_tickets") or []
+        ],
+    }
+
+def assemble_prompt(
+    base: Dict[str, Any],
+    ctx: Dict[str, Any],
+    hits: List[Dict[str, Any]],
+    original: Dict[str, Any],
+    budget: int = PROMPT_TOKEN_BUDGET,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Fit base fields + compacted SQL context + merged policy passages into `budget` tokens.
+
+    Over budget, drop the lowest-ranked similar tickets, then the oldest orders, then the weakest
+    policy passages (the best one is always kept). Returns the prompt and stats for the trace.
+    """
+    sql = compact_context(ctx)
+    passages = merge_chunks(hits)
+    dropped = {"similar_tickets": 0, "recent_orders": 0, "policy_passages": 0}
+
+    def build() -> Dict[str, Any]:
+        return {**base, "sql_context": sql, "policy_context": policy_block(passages)}
+
+    prompt = build()
+    tokens = count_tokens(prompt)
+    while tokens > budget:
+        if sql.get("similar_tickets"):
+            sql["similar_tickets"].pop()
+            dropped["similar_tickets"] += 1
+        elif sql.get("recent_orders"):
+            sql["recent_orders"].pop()
+            dropped["recent_orders"] += 1
+        elif len(passages) > 1:
+            passages.pop()
+            dropped["policy_passages"] += 1
+        else:
+            break
+        prompt = build()
+        tokens = count_tokens(prompt)
+    stats = {
+        "budget": budget,
+        "original_tokens": count_tokens(original),
+        "final_tokens": tokens,
+        "chunks_in": len(hits),
+        "passages_out": len(passages),
+        "dropped": dropped,
+    }
+    return prompt, stats
@@ -0,0 +1,186 @@
+from __future__ import annotations
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import faiss
+import numpy as np
+from agt.llm_cache import CACHE_PATH
+from db.conn import get_conn, transaction
+from rag.search import get_retriever
+
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE") == "1"
+SEMANTIC_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 20000))
+MAX_REPLACE_WORDS = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS semantic_cache (
+  agent_run_id INTEGER PRIMARY KEY,
+  scope        TEXT NOT NULL,
+  issue_text   TEXT NOT NULL,
+  names_json   TEXT,
+  response     TEXT NOT NULL,
+  vec          BLOB NOT NULL,
+  created_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_semantic_cache_created ON semantic_cache(created_at);
+"""
+
+def scope_key(model: str, tier: Optional[str], policy_context: str) -> str:
+    # Runs are only interchangeable for the same model, customer tier and retrieved policy text.
+    return hashlib.sha1(f"{model}\0{tier or ''}\0{policy_context}".encode("utf-8")).hexdigest()
+
+def _phrase(words: List[str]) -> str:
+    return " ".join(words).strip(".,;:!?\"'()")
+
+def replacements(old_issue: str, new_issue: str, old_names: Dict[str, str], new_names: Dict[str, str]) -> List[Tuple[str, str]]:
+    """Short phrases that were swapped between two templated issues (e.g. product names), plus changed names."""
+    a, b = old_issue.split(), new_issue.split()
+    out: Dict[str, str] = {}
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(a=a, b=b, autojunk=False).get_opcodes():
+        if op == "replace" and i2 - i1 <= MAX_REPLACE_WORDS and j2 - j1 <= MAX_REPLACE_WORDS:
+            old, new = _phrase(a[i1:i2]), _phrase(b[j1:j2])
+            if len(old) >= 3 and old != new:
+                out.setdefault(old, new)
+    for k, old in old_names.items():
+        new = new_names.get(k)
+        if old and new and old != new:
+            out.setdefault(old, new)
+    return sorted(out.items(), key=lambda kv: -len(kv[0]))
+
+def adapt(value: Any, swaps: List[Tuple[str, str]]) -> Any:
+    if isinstance(value, str):
+        for old, new in swaps:
+            value = re.sub(rf"\b{re.escape(old)}\b", new, value)
+        return value
+    if isinstance(value, list):
+        return [adapt(v, swaps) for v in value]
+    if isinstance(value, dict):
+        return {k: v if k == "source" else adapt(v, swaps) for k, v in value.items()}
+    return value
+
+@dataclass
+class SemanticHit:
+    agent_run_id: int
+    score: float
+    response: str
+    replacements: List[Tuple[str, str]] = field(default_factory=list)
+
+@dataclass
+class SemanticProbe:
+    vec: np.ndarray
+    scope: str
+    issue_text: str
+    names: Dict[str, str]
+    score: float = 0.0
+    hit: Optional[SemanticHit] = None
+
+class SemanticCache:
+    """Prior agent responses indexed by issue embedding, partitioned by scope, for near-duplicate reuse."""
+
+    def __init__(self, path: Path = CACHE_PATH, threshold: float = SEMANTIC_THRESHOLD, max_entries: int = SEMANTIC_MAX_ENTRIES):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._indexes: Optional[Dict[str, Any]] = None
+        self._scopes: Dict[int, str] = {}
+
+    def _index(self, scope: str):
+        if scope not in self._indexes:
+            self._indexes[scope] = faiss.IndexIDMap2(faiss.IndexFlatIP(get_retriever().dimension()))
+        return self._indexes[scope]
+
+    def _load(self) -> None:
+        if self._indexes is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with transaction(self.path) as conn:
+            conn.executescript(SCHEMA)
+        self._indexes = {}
+        rows = get_conn(db_path=self.path).execute("SELECT agent_run_id, scope, vec FROM semantic_cache").fetchall()
+        for run_id, scope, blob in rows:
+            self._index(scope).add_with_ids(np.frombuffer(blob, dtype="float32").reshape(1, -1), np.asarray([run_id], dtype="int64"))
+            self._scopes[run_id] = scope
+
+    def probe(
+        self,
+        issue_text: str,
+        model: str,
+        tier: Optional[str],
+        policy_context: str,
+        names: Optional[Dict[str, str]] = None,
+        search: bool = True,
+    ) -> SemanticProbe:
+        vec = get_retriever().encode([issue_text], use_cache=False)
+        p = SemanticProbe(vec=vec, scope=scope_key(model, tier, policy_context), issue_text=issue_text, names=names or {})
+        if not search:
+            return p
+        with self._lock:
+            self._load()
+            index = self._indexes.get(p.scope)
+            if index is None or index.ntotal == 0:
+                return p
+            scores, ids = index.search(vec, 1)
+        p.score = float(scores[0][0])
+        if p.score < self.threshold:
+            return p
+        row = get_conn(db_path=self.path).execute(
+            "SELECT issue_text, names_json, response FROM semantic_cache WHERE agent_run_id = ?",
+            (int(ids[0][0]),),
+        ).fetchone()
+        if row is None:
+            return p
+        swaps = replacements(row["issue_text"], issue_text, json.loads(row["names_json"] or "{}"), p.names)
+        response = json.dumps(adapt(json.loads(row["response"]), swaps), ensure_ascii=False) if swaps else row["response"]
+        p.hit = SemanticHit(agent_run_id=int(ids[0][0]), score=p.score, response=response, replacements=swaps)
+        return p
+
+    def add(self, agent_run_id: int, probe: SemanticProbe, response: str) -> None:
+        with self._lock:
+            self._load()
+            with transaction(self.path) as conn:
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO semantic_cache(agent_run_id, scope, issue_text, names_json, response, vec, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        agent_run_id,
+                        probe.scope,
+                        probe.issue_text,
+                        json.dumps(probe.names, ensure_ascii=False),
+                        response,
+                        probe.vec.astype("float32").tobytes(),
+                        time.time(),
+                    ),
+                )
+                stale = [r[0] for r in conn.execute(
+                    "SELECT agent_run_id FROM semantic_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                    (self.max_entries,),
+                ).fetchall()]
+                conn.executemany("DELETE FROM semantic_cache WHERE agent_run_id = ?", [(i,) for i in stale])
+            self._index(probe.scope).add_with_ids(probe.vec, np.asarray([agent_run_id], dtype="int64"))
+            self._scopes[agent_run_id] = probe.scope
+            for run_id in stale:
+                scope = self._scopes.pop(run_id, None)
+                if scope is not None:
+                    self._indexes[scope].remove_ids(np.asarray([run_id], dtype="int64"))
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+def get_semantic_cache() -> SemanticCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+    return _cache
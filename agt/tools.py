@@ -1,36 +1,40 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
 
 from db.sql_tool import (
-    get_ticket,
-    get_customer_recent_orders,
-    get_customer_ticket_stats,
-    similar_tickets_by_keywords,
+    get_ticket_context,
     insert_ticket_event,
 )
-from rag.search import search, format_context
-
-def tool_get_ticket_context(ticket_id: int) -> Dict[str, Any]:
-    t = get_ticket(ticket_id)
-    cid = t.get("customer_id")
-    orders = get_customer_recent_orders(cid, n=5) if cid else []
-    stats = get_customer_ticket_stats(cid) if cid else {}
-    sims = similar_tickets_by_keywords(ticket_id, k=5)
-    return {
-        "ticket": t,
-        "customer_stats": stats,
-        "recent_orders": orders,
-        "similar_tickets": sims,
-    }
+from rag.search import search, search_many, format_context, RAGHit
+from rag.ticket_index import similar_tickets_by_embedding
 
-def tool_rag_search(query: str, k: int = 5) -> Dict[str, Any]:
-    hits = search(query, k=k)
+T = TypeVar("T")
+
+def timed(timings: Dict[str, float], stage: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Call fn and record its wall time in milliseconds under timings[stage]."""
+    t0 = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[stage] = (time.perf_counter() - t0) * 1000
+
+def tool_get_ticket_context(ticket_id: int, use_cache: bool = True) -> Dict[str, Any]:
+    return get_ticket_context(ticket_id, use_cache=use_cache)
+
+def tool_similar_tickets_by_embedding(ticket_id: int, k: int = 5) -> List[Dict[str, Any]]:
+    return similar_tickets_by_embedding(ticket_id, k=k)
+
+def _rag_payload(hits: List[RAGHit]) -> Dict[str, Any]:
     return {
         "hits": [
             {
                 "score": h.score,
                 "cite": h.cite(),
+                "doc_id": h.doc_id,
+                "doc_title": h.doc_title,
+                "chunk_id": h.chunk_id,
                 "text": h.text,
             }
             for h in hits
@@ -38,6 +42,12 @@ def tool_rag_search(query: str, k: int = 5) -> Dict[str, Any]:
         "context_block": format_context(hits),
     }
 
+def tool_rag_search(query: str, k: int = 5) -> Dict[str, Any]:
+    return _rag_payload(search(query, k=k))
+
+def tool_rag_search_batch(queries: List[str], k: int = 5) -> List[Dict[str, Any]]:
+    return [_rag_payload(hits) for hits in search_many(queries, k=k)]
+
 def tool_create_ticket_event(ticket_id: int, event_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     insert_ticket_event(ticket_id, event_type, payload)
     return {"ok": True}
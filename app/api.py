@@ -1,41 +1,79 @@
 from __future__ import annotations
-import sqlite3
-from pathlib import Path
-from typing import Any, Dict, List, Optional
-from fastapi import FastAPI
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from agt.agent1 import run_agent
+from agt.agent1 import run_agent_async, run_agent_stream
+from agt.llm import DEFAULT_GEMINI_MODEL
+from agt.metrics import REGISTRY
+from rag.search import warmup
+from db.aggregates import ensure_aggregates
+from db.blobs import hydrate_json
+from db.conn import get_conn, close_all
+from db.logging import ensure_trace_schema, shutdown_traces
+from db.sql_tool import TICKET_PAGE_MAX, ensure_indexes, list_tickets_page, ticket_list_version
 
-DB_PATH = Path("db/app.db")
 app = FastAPI(title="OpsCopilot API")
+log = logging.getLogger(__name__)
+
+@app.on_event("startup")
+def _warm_retriever() -> None:
+    ensure_trace_schema()
+    ensure_indexes()
+    ensure_aggregates()
+    warmup()
+
+@app.on_event("shutdown")
+def _close_db() -> None:
+    shutdown_traces()
+    close_all()
 
 def _q(sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute(sql, params)
-    rows = cur.fetchall()
-    conn.close()
+    rows = get_conn(readonly=True).execute(sql, params).fetchall()
     return [dict(r) for r in rows]
 
 class RunAgentReq(BaseModel):
     ticket_id: Optional[int] = None
     free_text: Optional[str] = None
-    model: str = "gemini-1.5-flash"
+    model: Optional[str] = None  # agt.llm.DEFAULT_GEMINI_MODEL when omitted
+    bypass_cache: bool = False
 
 @app.get("/tickets")
-def list_tickets(limit: int = 50) -> List[Dict[str, Any]]:
-    return _q(
-        """
-        SELECT t.id, t.subject, t.status, t.priority, t.category, t.created_at,
-               c.name AS customer_name, c.tier AS customer_tier
-        FROM tickets t
-        LEFT JOIN customers c ON c.id = t.customer_id
-        ORDER BY t.created_at DESC
-        LIMIT ?
-        """,
-        (limit,),
-    )
+def list_tickets(
+    request: Request,
+    limit: int = Query(50, ge=1, le=TICKET_PAGE_MAX),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    category: Optional[str] = None,
+    tier: Optional[str] = None,
+) -> Response:
+    """One page of tickets, newest first. The next page's cursor is in X-Next-Cursor (absent on the last page).
+
+    The ETag comes from ticket_list_version and the request, so a matching If-None-Match is answered
+    before the page query runs. The version is read first: a write in between only makes the tag stale.
+    """
+    headers = {"Cache-Control": "no-cache"}
+    version = ticket_list_version()
+    if version is not None:
+        key = json.dumps([version, limit, cursor, status, priority, category, tier])
+        headers["ETag"] = '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+        if headers["ETag"] in {t.strip() for t in request.headers.get("if-none-match", "").split(",")}:
+            return Response(status_code=304, headers=headers)
+    try:
+        rows, next_cursor = list_tickets_page(
+            limit, cursor, tier=tier, status=status, priority=priority, category=category
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    body = json.dumps(rows, ensure_ascii=False, separators=(",", ":"))
+    return Response(body, media_type="application/json", headers=headers)
 
 @app.get("/tickets/{ticket_id}")
 def get_ticket(ticket_id: int) -> Dict[str, Any]:
@@ -48,21 +86,72 @@ def get_ticket(ticket_id: int) -> Dict[str, Any]:
         """,
         (ticket_id,),
     )
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"ticket {ticket_id} not found")
     return rows[0]
 
 @app.get("/runs/{agent_run_id}/tool_calls")
 def get_tool_calls(agent_run_id: int) -> List[Dict[str, Any]]:
-    return _q(
+    rows = _q(
         """
-        SELECT id, tool_name, tool_input_json, tool_output_json, created_at
+        SELECT id, tool_name, tool_input_json, tool_output_json,
+               duration_ms, prompt_tokens, completion_tokens, created_at
         FROM tool_calls
         WHERE agent_run_id = ?
         ORDER BY id ASC
         """,
         (agent_run_id,),
     )
+    # Large payload strings are stored as compressed blob references; expand them for the client.
+    texts = hydrate_json(get_conn(readonly=True), [r[c] for r in rows for c in ("tool_input_json", "tool_output_json")])
+    for n, r in enumerate(rows):
+        r["tool_input_json"], r["tool_output_json"] = texts[2 * n], texts[2 * n + 1]
+    return rows
+
+async def _require_ticket(ticket_id: Optional[int]) -> None:
+    if ticket_id is not None and not await asyncio.to_thread(_q, "SELECT 1 FROM tickets WHERE id = ?", (ticket_id,)):
+        raise HTTPException(status_code=404, detail=f"ticket {ticket_id} not found")
 
 @app.post("/run_agent1")
-def run_agent_endpoint(req: RunAgentReq) -> Dict[str, Any]:
-    res = run_agent(ticket_id=req.ticket_id, free_text=req.free_text, model=req.model)
-    return {"agent_run_id": res.agent_run_id, "result": res.result}
\ No newline at end of file
+async def run_agent_endpoint(req: RunAgentReq) -> Dict[str, Any]:
+    await _require_ticket(req.ticket_id)
+    res = await run_agent_async(
+        ticket_id=req.ticket_id,
+        free_text=req.free_text,
+        model=req.model or DEFAULT_GEMINI_MODEL,
+        use_cache=not req.bypass_cache,
+    )
+    return {"agent_run_id": res.agent_run_id, "result": res.result}
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/run_agent1/stream")
+async def run_agent_stream_endpoint(req: RunAgentReq) -> StreamingResponse:
+    # Checked before the 200 and the event stream start, so an unknown ticket is a plain 404.
+    await _require_ticket(req.ticket_id)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event, data in run_agent_stream(
+                ticket_id=req.ticket_id,
+                free_text=req.free_text,
+                model=req.model or DEFAULT_GEMINI_MODEL,
+                use_cache=not req.bypass_cache,
+            ):
+                yield _sse(event, data)
+        except KeyError:
+            yield _sse("error", {"detail": f"ticket {req.ticket_id} not found"})
+        except Exception:
+            log.exception("agent stream failed for ticket %s", req.ticket_id)
+            yield _sse("error", {"detail": "agent run failed"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics")
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
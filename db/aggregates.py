@@ -0,0 +1,78 @@
+from __future__ import annotations
+import sqlite3
+from pathlib import Path
+from typing import Dict, List, Optional
+from db.conn import schema_statements, transaction
+
+# Per-customer and per-category ticket counts kept current by triggers on tickets, so the customer
+# stats in every agent context and the category dashboard are key lookups instead of scans.
+# The DDL lives only in db/schema.sql; ensure_aggregates applies those statements to older databases.
+# Groups whose count drops to zero are deleted, so each table always equals the GROUP BY in LIVE_SQL.
+TABLES = ("customer_ticket_stats", "category_ticket_stats")
+TRIGGERS = ("tickets_stats_ai", "tickets_stats_ad", "tickets_stats_au")
+# The GET /tickets validator. Its triggers are recreated with the others, but the counter itself is kept
+# and bumped instead, so an ETag issued before the rebuild can never match again.
+VERSION_TABLE = "ticket_list_version"
+VERSION_TRIGGERS = ("tickets_version_ai", "tickets_version_ad", "tickets_version_au", "customers_version_au")
+BUMP_VERSION_SQL = (
+    "INSERT INTO ticket_list_version(id, version) VALUES (1, 1) ON CONFLICT(id) DO UPDATE SET version = version + 1"
+)
+
+# The same numbers aggregated from tickets; used to rebuild the tables and to verify them.
+LIVE_SQL = {
+    "customer_ticket_stats": """
+        SELECT customer_id,
+               COUNT(*),
+               SUM(status IS 'open'),
+               SUM(status IS 'closed'),
+               SUM(priority IS 'high' OR priority IS 'urgent')
+        FROM tickets
+        WHERE customer_id IS NOT NULL
+        GROUP BY customer_id
+    """,
+    "category_ticket_stats": """
+        SELECT COALESCE(category, '(none)'), COUNT(*), SUM(status IS 'open')
+        FROM tickets
+        GROUP BY COALESCE(category, '(none)')
+    """,
+}
+
+def rebuild_aggregates(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Recompute every summary table from tickets in the caller's transaction; returns rows written per table."""
+    counts: Dict[str, int] = {}
+    for table, sql in LIVE_SQL.items():
+        conn.execute(f"DELETE FROM {table}")
+        counts[table] = conn.execute(f"INSERT INTO {table} {sql}").rowcount
+    return counts
+
+def diff_aggregates(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Rows that differ between each summary table and a live aggregation (0 everywhere when consistent)."""
+    return {
+        table: conn.execute(
+            f"SELECT (SELECT COUNT(*) FROM (SELECT * FROM {table} EXCEPT {sql})) "
+            f"+ (SELECT COUNT(*) FROM ({sql} EXCEPT SELECT * FROM {table}))"
+        ).fetchone()[0]
+        for table, sql in LIVE_SQL.items()
+    }
+
+def missing_objects(conn: sqlite3.Connection) -> List[str]:
+    have = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+    return [name for name in TABLES + TRIGGERS + (VERSION_TABLE,) + VERSION_TRIGGERS if name not in have]
+
+def ensure_aggregates(db_path: Optional[Path] = None) -> bool:
+    """Create and fill the summary tables and triggers in one transaction if any is missing. True if (re)created."""
+    with transaction(db_path) as conn:
+        if not missing_objects(conn):
+            return False
+        # DDL does not open a transaction implicitly; without BEGIN a crash could leave half-filled tables.
+        conn.execute("BEGIN IMMEDIATE")
+        for name in TRIGGERS + VERSION_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for name in TABLES:
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
+        stmts = schema_statements((VERSION_TABLE,), if_not_exists=True) + schema_statements(TABLES + TRIGGERS + VERSION_TRIGGERS)
+        for stmt in stmts:
+            conn.execute(stmt)
+        rebuild_aggregates(conn)
+        conn.execute(BUMP_VERSION_SQL)
+    return True
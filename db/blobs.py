@@ -0,0 +1,134 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import zlib
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+BLOB_MIN_CHARS = int(os.environ.get("TRACE_BLOB_MIN_CHARS", 512))
+BLOB_REF = "$blob"
+REF_RE = re.compile(r'"\$blob":\s*"([0-9a-f]{64})"')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+  hash       TEXT PRIMARY KEY,
+  kind       TEXT NOT NULL DEFAULT 'text',
+  size       INTEGER NOT NULL,
+  data       BLOB NOT NULL,
+  created_at TEXT DEFAULT (datetime('now'))
+);
+"""
+INSERT_BLOB_SQL = "INSERT OR IGNORE INTO blobs(hash, kind, size, data) VALUES (?, ?, ?, ?)"
+
+BlobRow = Tuple[str, str, int, bytes]
+
+def _blob(text: str, kind: str, rows: Dict[str, BlobRow]) -> Dict[str, str]:
+    raw = text.encode("utf-8")
+    h = hashlib.sha256(raw).hexdigest()
+    if h not in rows:
+        rows[h] = (h, kind, len(raw), zlib.compress(raw))
+    ref = {BLOB_REF: h}
+    if kind != "text":
+        ref["kind"] = kind
+    return ref
+
+def _pack(value: Any, min_chars: int, rows: Dict[str, BlobRow]) -> Any:
+    if isinstance(value, str):
+        return _blob(value, "text", rows) if len(value) >= min_chars else value
+    if isinstance(value, list):
+        return [_pack(v, min_chars, rows) for v in value]
+    if isinstance(value, dict):
+        return {k: _pack(v, min_chars, rows) for k, v in value.items()}
+    return value
+
+def encode_payload(obj: Any, min_chars: int = BLOB_MIN_CHARS) -> Tuple[str, List[BlobRow]]:
+    """JSON for a tool_calls column with long strings (and oversized documents) moved to compressed, content-addressed blobs."""
+    if min_chars <= 0:
+        return json.dumps(obj, ensure_ascii=False), []
+    rows: Dict[str, BlobRow] = {}
+    text = json.dumps(_pack(obj, min_chars, rows), ensure_ascii=False)
+    if len(text) >= 4 * min_chars:
+        text = json.dumps(_blob(text, "json", rows))
+    return text, list(rows.values())
+
+def _is_ref(v: Any) -> bool:
+    return isinstance(v, dict) and BLOB_REF in v and set(v) <= {BLOB_REF, "kind"}
+
+def _refs(value: Any, out: Set[str]) -> None:
+    if _is_ref(value):
+        out.add(value[BLOB_REF])
+    elif isinstance(value, list):
+        for v in value:
+            _refs(v, out)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _refs(v, out)
+
+def _fetch(conn: sqlite3.Connection, hashes: Iterable[str]) -> Dict[str, Any]:
+    hashes = list(hashes)
+    found: Dict[str, Any] = {}
+    for i in range(0, len(hashes), 500):
+        part = hashes[i:i + 500]
+        rows = conn.execute(
+            f"SELECT hash, kind, data FROM blobs WHERE hash IN ({','.join('?' * len(part))})", part
+        ).fetchall()
+        for h, kind, data in rows:
+            text = zlib.decompress(data).decode("utf-8")
+            found[h] = json.loads(text) if kind == "json" else text
+    return found
+
+def _resolve(value: Any, blobs: Dict[str, Any]) -> Any:
+    if _is_ref(value):
+        h = value[BLOB_REF]
+        return _resolve(blobs[h], blobs) if h in blobs else value
+    if isinstance(value, list):
+        return [_resolve(v, blobs) for v in value]
+    if isinstance(value, dict):
+        return {k: _resolve(v, blobs) for k, v in value.items()}
+    return value
+
+def hydrate(conn: sqlite3.Connection, payloads: List[Any]) -> List[Any]:
+    """Replace blob references in decoded payloads with their content; one query per nesting level."""
+    blobs: Dict[str, Any] = {}
+    pending: Set[str] = set()
+    for p in payloads:
+        _refs(p, pending)
+    while pending:
+        try:
+            fetched = _fetch(conn, pending)
+        except sqlite3.OperationalError as e:
+            if "no such table" not in str(e):
+                raise
+            break
+        blobs.update(fetched)
+        pending = set()
+        for v in fetched.values():
+            _refs(v, pending)
+        pending -= set(blobs)
+    return [_resolve(p, blobs) for p in payloads]
+
+def hydrate_json(conn: sqlite3.Connection, texts: List[str]) -> List[str]:
+    payloads = hydrate(conn, [json.loads(t) if t else None for t in texts])
+    return [json.dumps(p, ensure_ascii=False) if p is not None else t for p, t in zip(payloads, texts)]
+
+def referenced_hashes(conn: sqlite3.Connection) -> Set[str]:
+    """Every blob reachable from tool_calls, following references inside JSON-document blobs."""
+    live: Set[str] = set()
+    for inp, out in conn.execute("SELECT tool_input_json, tool_output_json FROM tool_calls"):
+        live.update(REF_RE.findall(inp or ""))
+        live.update(REF_RE.findall(out or ""))
+    frontier = set(live)
+    while frontier:
+        nested: Set[str] = set()
+        part = list(frontier)
+        for i in range(0, len(part), 500):
+            chunk = part[i:i + 500]
+            for (data,) in conn.execute(
+                f"SELECT data FROM blobs WHERE kind = 'json' AND hash IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                nested.update(REF_RE.findall(zlib.decompress(data).decode("utf-8")))
+        frontier = nested - live
+        live |= nested
+    return live
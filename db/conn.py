@@ -0,0 +1,95 @@
+from __future__ import annotations
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DB_PATH = Path("db/app.db")
+SCHEMA_PATH = Path(__file__).with_name("schema.sql")
+
+PRAGMAS = {
+    "synchronous": "NORMAL",
+    "cache_size": -32000,
+    "mmap_size": 256 * 1024 * 1024,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+_all: List[sqlite3.Connection] = []
+_all_lock = threading.Lock()
+_generation = 0
+
+def connect(db_path: Optional[Path] = None, readonly: bool = False) -> sqlite3.Connection:
+    path = Path(db_path or DB_PATH)
+    if readonly:
+        conn = sqlite3.connect(
+            f"file:{path.resolve()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        conn.execute("PRAGMA journal_mode = WAL")
+    for k, v in PRAGMAS.items():
+        conn.execute(f"PRAGMA {k} = {v}")
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def get_conn(readonly: bool = False, db_path: Optional[Path] = None) -> sqlite3.Connection:
+    """Per-thread pooled connection; separate read-only and read-write handles per database file."""
+    pool: Optional[Dict[Tuple[str, bool], sqlite3.Connection]] = getattr(_local, "pool", None)
+    if pool is None or _local.generation != _generation:
+        pool = _local.pool = {}
+        _local.generation = _generation
+    key = (str(Path(db_path or DB_PATH).resolve()), readonly)
+    conn = pool.get(key)
+    if conn is None:
+        conn = connect(db_path, readonly=readonly)
+        pool[key] = conn
+        with _all_lock:
+            _all.append(conn)
+    return conn
+
+def schema_statements(names: Tuple[str, ...], if_not_exists: bool = False) -> List[str]:
+    """CREATE statements for the named tables/triggers/indexes, read from db/schema.sql (the single copy of the DDL)."""
+    stmts: List[str] = []
+    buf = ""
+    for line in SCHEMA_PATH.read_text(encoding="utf-8").splitlines(keepends=True):
+        if not buf.strip() and (not line.strip() or line.lstrip().startswith("--")):
+            continue
+        buf += line
+        if sqlite3.complete_statement(buf):
+            stmts.append(buf.strip())
+            buf = ""
+    pattern = re.compile(rf"CREATE (TABLE|TRIGGER|INDEX) ({'|'.join(map(re.escape, names))})\b")
+    found = [s for s in stmts if pattern.match(s)]
+    if len(found) != len(names):
+        raise RuntimeError(f"{SCHEMA_PATH} defines {len(found)} of {len(names)} objects: {', '.join(names)}")
+    if if_not_exists:
+        found = [pattern.sub(r"CREATE \1 IF NOT EXISTS \2", s, count=1) for s in found]
+    return found
+
+@contextmanager
+def transaction(db_path: Optional[Path] = None) -> Iterator[sqlite3.Connection]:
+    conn = get_conn(db_path=db_path)
+    with conn:
+        yield conn
+
+def close_all() -> None:
+    """Close every pooled connection; threads transparently reconnect on next use."""
+    global _generation
+    with _all_lock:
+        conns = list(_all)
+        _all.clear()
+        _generation += 1
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
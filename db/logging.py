@@ -1,55 +1,201 @@
 from __future__ import annotations
-import json
+import atexit
+import logging
+import os
+import queue
 import sqlite3
+import threading
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
+from db.blobs import INSERT_BLOB_SQL, SCHEMA as BLOB_SCHEMA, encode_payload
+from db.conn import DB_PATH, connect, transaction
 
-DB_PATH = Path("db/app.db")
+log = logging.getLogger(__name__)
 
-def _connect() -> sqlite3.Connection:
-    return sqlite3.connect(DB_PATH)
+Statement = Tuple[str, Tuple[Any, ...]]
+FLUSH_TIMEOUT_S = float(os.environ.get("TRACE_FLUSH_TIMEOUT_S", 5))
+
+class TraceWriter:
+    """Write-behind sink for trace rows: a background thread drains a bounded queue and commits in batches."""
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        sync: bool = False,
+    ):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.sync = sync
+        self._q: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stop = object()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, sql: str, params: Tuple[Any, ...]) -> None:
+        if self.sync:
+            with transaction(self.db_path) as conn:
+                conn.execute(sql, params)
+            return
+        self._ensure_started()
+        self._q.put((sql, params))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything submitted before this call is committed; False if the timeout ran out first."""
+        if self.sync or (self._thread is None and self._q.empty()):
+            return True
+        self._ensure_started()  # a writer that died leaves nothing to set the event
+        done = threading.Event()
+        self._q.put(done)
+        if not done.wait(timeout):
+            log.warning("trace-writer: flush timed out after %.1fs", timeout)
+            return False
+        return True
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._q.put(self._stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        waiters: List[threading.Event] = []
+        conn = connect(self.db_path)
+        try:
+            while True:
+                item = self._q.get()
+                batch: List[Statement] = []
+                stop = False
+                while True:
+                    if item is self._stop:
+                        stop = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        batch.append(item)
+                    if stop or len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+                self._commit(conn, batch)
+                for w in waiters:
+                    w.set()
+                waiters.clear()
+                if stop:
+                    return
+        except Exception:
+            log.exception("trace-writer: stopped; the next submit or flush restarts it")
+        finally:
+            conn.close()
+            for w in waiters:
+                w.set()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Statement]) -> None:
+        if not batch:
+            return
+        try:
+            with conn:
+                for sql, params in batch:
+                    conn.execute(sql, params)
+        except sqlite3.Error:
+            # Retry row by row so one bad row does not drop the rest of the group.
+            for sql, params in batch:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    log.warning("trace-writer: dropped row (%s): %s", e, " ".join(sql.split()[:3]))
+
+_WRITER = TraceWriter(sync=os.environ.get("TRACE_SYNC") == "1")
+atexit.register(_WRITER.close)
+
+TIMING_COLUMNS = {"duration_ms": "REAL", "prompt_tokens": "INTEGER", "completion_tokens": "INTEGER"}
+_trace_schema_ready = False
+_trace_schema_lock = threading.Lock()
+
+def ensure_trace_schema() -> None:
+    # Databases created before payload blobs and timing columns existed are upgraded on first use.
+    global _trace_schema_ready
+    if _trace_schema_ready:
+        return
+    with _trace_schema_lock:
+        if not _trace_schema_ready:
+            with transaction() as conn:
+                conn.executescript(BLOB_SCHEMA)
+                have = {r[1] for r in conn.execute("PRAGMA table_info(tool_calls)")}
+                for col, decl in TIMING_COLUMNS.items():
+                    if col not in have:
+                        conn.execute(f"ALTER TABLE tool_calls ADD COLUMN {col} {decl}")
+            _trace_schema_ready = True
+
+def get_trace_writer() -> TraceWriter:
+    return _WRITER
+
+def set_sync_mode(sync: bool) -> None:
+    _WRITER.flush()
+    _WRITER.sync = sync
+
+def flush_traces(timeout: Optional[float] = None) -> bool:
+    return _WRITER.flush(timeout)
+
+def shutdown_traces(timeout: Optional[float] = None) -> None:
+    _WRITER.close(timeout)
 
 def create_agent_run(ticket_id: Optional[int], input_text: str) -> int:
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO agent_runs(ticket_id, input_text) VALUES (?, ?)",
-        (ticket_id, input_text),
-    )
-    conn.commit()
-    row_id = int(cur.lastrowid)
-    conn.close()
-    return row_id
+    # Runs are inserted synchronously: callers need the id to tag every later trace row.
+    with transaction() as conn:
+        cur = conn.execute(
+            "INSERT INTO agent_runs(ticket_id, input_text) VALUES (?, ?)",
+            (ticket_id, input_text),
+        )
+        return int(cur.lastrowid)
 
 def update_agent_run(agent_run_id: int, final_answer: str) -> None:
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute(
+    _WRITER.submit(
         "UPDATE agent_runs SET final_answer = ? WHERE id = ?",
         (final_answer, agent_run_id),
     )
-    conn.commit()
-    conn.close()
 
 def log_tool_call(
     agent_run_id: int,
     tool_name: str,
     tool_input: Dict[str, Any],
     tool_output: Dict[str, Any],
+    duration_ms: Optional[float] = None,
+    usage: Optional[Dict[str, int]] = None,
 ) -> None:
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute(
+    ensure_trace_schema()
+    input_json, input_blobs = encode_payload(tool_input)
+    output_json, output_blobs = encode_payload(tool_output)
+    # Queued ahead of the row that references them, so they land in the same or an earlier commit.
+    for row in input_blobs + output_blobs:
+        _WRITER.submit(INSERT_BLOB_SQL, row)
+    usage = usage or {}
+    _WRITER.submit(
         """
-        INSERT INTO tool_calls(agent_run_id, tool_name, tool_input_json, tool_output_json)
-        VALUES (?, ?, ?, ?)
+        INSERT INTO tool_calls(agent_run_id, tool_name, tool_input_json, tool_output_json,
+                               duration_ms, prompt_tokens, completion_tokens)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
         """,
         (
             agent_run_id,
             tool_name,
-            json.dumps(tool_input, ensure_ascii=False),
-            json.dumps(tool_output, ensure_ascii=False),
+            input_json,
+            output_json,
+            round(duration_ms, 3) if duration_ms is not None else None,
+            usage.get("prompt_tokens"),
+            usage.get("completion_tokens"),
         ),
     )
-    conn.commit()
-    conn.close()
\ No newline at end of file
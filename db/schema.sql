@@ -1,7 +1,14 @@
 -- db/schema.sql
 PRAGMA foreign_keys = ON;
 
+DROP TABLE IF EXISTS tickets_fts;
+DROP TABLE IF EXISTS customer_ticket_stats;
+DROP TABLE IF EXISTS category_ticket_stats;
+DROP TABLE IF EXISTS ticket_list_version;
+DROP TABLE IF EXISTS triage_items;
+DROP TABLE IF EXISTS triage_jobs;
 DROP TABLE IF EXISTS tool_calls;
+DROP TABLE IF EXISTS blobs;
 DROP TABLE IF EXISTS agent_runs;
 DROP TABLE IF EXISTS ticket_events;
 DROP TABLE IF EXISTS tickets;
@@ -46,6 +53,118 @@ CREATE TABLE tickets (
   FOREIGN KEY(customer_id) REFERENCES customers(id)
 );
 
+-- Full-text index over tickets for similar-ticket lookup; kept in sync by the triggers below.
+CREATE VIRTUAL TABLE tickets_fts USING fts5(
+  subject,
+  body,
+  content='tickets',
+  content_rowid='id',
+  tokenize='porter unicode61'
+);
+
+CREATE TRIGGER tickets_fts_ai AFTER INSERT ON tickets BEGIN
+  INSERT INTO tickets_fts(rowid, subject, body) VALUES (new.id, new.subject, new.body);
+END;
+
+CREATE TRIGGER tickets_fts_ad AFTER DELETE ON tickets BEGIN
+  INSERT INTO tickets_fts(tickets_fts, rowid, subject, body) VALUES ('delete', old.id, old.subject, old.body);
+END;
+
+CREATE TRIGGER tickets_fts_au AFTER UPDATE OF subject, body ON tickets BEGIN
+  INSERT INTO tickets_fts(tickets_fts, rowid, subject, body) VALUES ('delete', old.id, old.subject, old.body);
+  INSERT INTO tickets_fts(rowid, subject, body) VALUES (new.id, new.subject, new.body);
+END;
+
+-- Per-customer and per-category ticket counts, kept current by the triggers below. Single source for this DDL:
+-- db/aggregates.py applies these statements to older databases; scr/rebuild_aggregates.py repairs the data.
+CREATE TABLE customer_ticket_stats (
+  customer_id           INTEGER PRIMARY KEY,
+  total_tickets         INTEGER NOT NULL,
+  open_tickets          INTEGER NOT NULL,
+  closed_tickets        INTEGER NOT NULL,
+  high_priority_tickets INTEGER NOT NULL
+);
+
+CREATE TABLE category_ticket_stats (
+  category     TEXT PRIMARY KEY,
+  n            INTEGER NOT NULL,
+  open_tickets INTEGER NOT NULL
+);
+
+CREATE TRIGGER tickets_stats_ai AFTER INSERT ON tickets BEGIN
+  INSERT INTO customer_ticket_stats(customer_id, total_tickets, open_tickets, closed_tickets, high_priority_tickets)
+  SELECT new.customer_id, 1, new.status IS 'open', new.status IS 'closed', new.priority IS 'high' OR new.priority IS 'urgent'
+  WHERE new.customer_id IS NOT NULL
+  ON CONFLICT(customer_id) DO UPDATE SET
+    total_tickets = total_tickets + 1,
+    open_tickets = open_tickets + excluded.open_tickets,
+    closed_tickets = closed_tickets + excluded.closed_tickets,
+    high_priority_tickets = high_priority_tickets + excluded.high_priority_tickets;
+  INSERT INTO category_ticket_stats(category, n, open_tickets)
+  VALUES (COALESCE(new.category, '(none)'), 1, new.status IS 'open')
+  ON CONFLICT(category) DO UPDATE SET n = n + 1, open_tickets = open_tickets + excluded.open_tickets;
+END;
+
+CREATE TRIGGER tickets_stats_ad AFTER DELETE ON tickets BEGIN
+  UPDATE customer_ticket_stats SET
+    total_tickets = total_tickets - 1,
+    open_tickets = open_tickets - (old.status IS 'open'),
+    closed_tickets = closed_tickets - (old.status IS 'closed'),
+    high_priority_tickets = high_priority_tickets - (old.priority IS 'high' OR old.priority IS 'urgent')
+  WHERE customer_id = old.customer_id;
+  DELETE FROM customer_ticket_stats WHERE customer_id = old.customer_id AND total_tickets <= 0;
+  UPDATE category_ticket_stats SET n = n - 1, open_tickets = open_tickets - (old.status IS 'open')
+  WHERE category = COALESCE(old.category, '(none)');
+  DELETE FROM category_ticket_stats WHERE category = COALESCE(old.category, '(none)') AND n <= 0;
+END;
+
+CREATE TRIGGER tickets_stats_au AFTER UPDATE OF customer_id, status, priority, category ON tickets BEGIN
+  UPDATE customer_ticket_stats SET
+    total_tickets = total_tickets - 1,
+    open_tickets = open_tickets - (old.status IS 'open'),
+    closed_tickets = closed_tickets - (old.status IS 'closed'),
+    high_priority_tickets = high_priority_tickets - (old.priority IS 'high' OR old.priority IS 'urgent')
+  WHERE customer_id = old.customer_id;
+  DELETE FROM customer_ticket_stats WHERE customer_id = old.customer_id AND total_tickets <= 0;
+  INSERT INTO customer_ticket_stats(customer_id, total_tickets, open_tickets, closed_tickets, high_priority_tickets)
+  SELECT new.customer_id, 1, new.status IS 'open', new.status IS 'closed', new.priority IS 'high' OR new.priority IS 'urgent'
+  WHERE new.customer_id IS NOT NULL
+  ON CONFLICT(customer_id) DO UPDATE SET
+    total_tickets = total_tickets + 1,
+    open_tickets = open_tickets + excluded.open_tickets,
+    closed_tickets = closed_tickets + excluded.closed_tickets,
+    high_priority_tickets = high_priority_tickets + excluded.high_priority_tickets;
+  UPDATE category_ticket_stats SET n = n - 1, open_tickets = open_tickets - (old.status IS 'open')
+  WHERE category = COALESCE(old.category, '(none)');
+  DELETE FROM category_ticket_stats WHERE category = COALESCE(old.category, '(none)') AND n <= 0;
+  INSERT INTO category_ticket_stats(category, n, open_tickets)
+  VALUES (COALESCE(new.category, '(none)'), 1, new.status IS 'open')
+  ON CONFLICT(category) DO UPDATE SET n = n + 1, open_tickets = open_tickets + excluded.open_tickets;
+END;
+
+-- One-row counter bumped by every write that can change a GET /tickets page; the API derives the page ETag
+-- from it, so If-None-Match is answered without running the page query. Applied by db/aggregates.py too.
+CREATE TABLE ticket_list_version (
+  id      INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL
+);
+
+CREATE TRIGGER tickets_version_ai AFTER INSERT ON tickets BEGIN
+  INSERT INTO ticket_list_version(id, version) VALUES (1, 1) ON CONFLICT(id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER tickets_version_ad AFTER DELETE ON tickets BEGIN
+  INSERT INTO ticket_list_version(id, version) VALUES (1, 1) ON CONFLICT(id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER tickets_version_au AFTER UPDATE OF customer_id, subject, status, priority, category, created_at ON tickets BEGIN
+  INSERT INTO ticket_list_version(id, version) VALUES (1, 1) ON CONFLICT(id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER customers_version_au AFTER UPDATE OF name, tier ON customers BEGIN
+  INSERT INTO ticket_list_version(id, version) VALUES (1, 1) ON CONFLICT(id) DO UPDATE SET version = version + 1;
+END;
+
 CREATE TABLE ticket_events (
   id          INTEGER PRIMARY KEY,
   ticket_id   INTEGER NOT NULL,
@@ -70,10 +189,50 @@ CREATE TABLE tool_calls (
   tool_name      TEXT NOT NULL,
   tool_input_json  TEXT,
   tool_output_json TEXT,
+  duration_ms    REAL,     -- wall time of the tool/LLM call (monotonic clock)
+  prompt_tokens  INTEGER,  -- LLM token usage, when the backend reports it
+  completion_tokens INTEGER,
   created_at     TEXT DEFAULT (datetime('now')),
   FOREIGN KEY(agent_run_id) REFERENCES agent_runs(id)
 );
 
-CREATE INDEX idx_tickets_customer ON tickets(customer_id);
-CREATE INDEX idx_orders_customer ON orders(customer_id);
+-- Content-addressed, zlib-compressed payloads referenced from tool_calls JSON as {"$blob": "<sha256>"}.
+CREATE TABLE blobs (
+  hash       TEXT PRIMARY KEY,
+  kind       TEXT NOT NULL DEFAULT 'text',
+  size       INTEGER NOT NULL,
+  data       BLOB NOT NULL,
+  created_at TEXT DEFAULT (datetime('now'))
+);
+
+-- Checkpoints for scr/run_triage.py: one job per named batch run, one item per selected ticket.
+CREATE TABLE triage_jobs (
+  id           INTEGER PRIMARY KEY,
+  name         TEXT NOT NULL UNIQUE,
+  filters_json TEXT,
+  created_at   TEXT DEFAULT (datetime('now'))
+);
+
+CREATE TABLE triage_items (
+  job_id       INTEGER NOT NULL,
+  ticket_id    INTEGER NOT NULL,
+  status       TEXT NOT NULL DEFAULT 'pending',
+  agent_run_id INTEGER,
+  error        TEXT,
+  attempts     INTEGER NOT NULL DEFAULT 0,
+  timings_json TEXT,
+  updated_at   TEXT DEFAULT (datetime('now')),
+  PRIMARY KEY(job_id, ticket_id),
+  FOREIGN KEY(job_id) REFERENCES triage_jobs(id)
+);
+
+-- Index set matched to the queries in db/sql_tool.py and app/api.py (see scr/test_query_plans.py).
+CREATE INDEX idx_tickets_customer_status ON tickets(customer_id, status, priority);
+-- Ticket list (GET /tickets): newest first, optionally filtered; these are covering for the id page.
+CREATE INDEX idx_tickets_created ON tickets(created_at, id, status, priority, category, customer_id);
+CREATE INDEX idx_tickets_status_created ON tickets(status, created_at, id, priority, category, customer_id);
+CREATE INDEX idx_tickets_category_created ON tickets(category, created_at, id, status, priority, customer_id);
+CREATE INDEX idx_customers_tier ON customers(tier, id);
+CREATE INDEX idx_orders_customer_created ON orders(customer_id, created_at);
+CREATE INDEX idx_ticket_events_ticket ON ticket_events(ticket_id, created_at);
 CREATE INDEX idx_tool_calls_run ON tool_calls(agent_run_id);
@@ -1,12 +1,19 @@
 from __future__ import annotations
+import base64
 import json
 import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from db.conn import DB_PATH, get_conn, transaction
+from db.logging import get_trace_writer
 
-DB_PATH = Path("db/app.db")
+PREVIEW_SQL = "replace(replace(replace(substr({col},1,160), char(10), ' '), char(13), ' '), char(9), ' ')"
 
 @dataclass
 class SQLResult:
@@ -16,19 +23,12 @@ class SQLResult:
     def to_dict(self) -> Dict[str, Any]:
         return {"columns": self.columns, "rows": [list(r) for r in self.rows]}
 
-def _connect(db_path: Path = DB_PATH) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def sql_query(query: str, params: Optional[Tuple[Any, ...]] = None, limit: int = 200) -> SQLResult:
     q = query.strip().rstrip(";")
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute(q, params or ())
+    cur = get_conn(readonly=True).execute(q, params or ())
     rows = cur.fetchmany(limit)
     cols = [d[0] for d in cur.description] if cur.description else []
-    conn.close()
+    cur.close()
     return SQLResult(columns=cols, rows=[tuple(r) for r in rows])
 
 def get_ticket(ticket_id: int) -> Dict[str, Any]:
@@ -44,6 +44,8 @@ def get_ticket(ticket_id: int) -> Dict[str, Any]:
         (ticket_id,),
         limit=1,
     )
+    if not res.rows:
+        raise KeyError(f"ticket {ticket_id} not found")
     row = res.rows[0]
     return dict(zip(res.columns, row))
 
@@ -63,7 +65,32 @@ def get_customer_recent_orders(customer_id: int, n: int = 5) -> List[Dict[str, A
     )
     return [dict(zip(res.columns, r)) for r in res.rows]
 
-def get_customer_ticket_stats(customer_id: int) -> Dict[str, Any]:
+def _no_aggregates(e: sqlite3.OperationalError) -> bool:
+    # Databases seeded before db/aggregates.py existed have no summary tables yet.
+    return "ticket_stats" in str(e) or "ticket_list_version" in str(e)
+
+def get_customer_ticket_stats(customer_id: int, live: bool = False) -> Dict[str, Any]:
+    """Ticket counts for a customer from customer_ticket_stats; live=True aggregates tickets instead (for verification)."""
+    if not live:
+        try:
+            # MAX() over at most one row keeps the live query's shape for customers without tickets.
+            res = sql_query(
+                """
+                SELECT
+                  COALESCE(MAX(total_tickets), 0) AS total_tickets,
+                  MAX(open_tickets) AS open_tickets,
+                  MAX(closed_tickets) AS closed_tickets,
+                  MAX(high_priority_tickets) AS high_priority_tickets
+                FROM customer_ticket_stats
+                WHERE customer_id = ?
+                """,
+                (customer_id,),
+                limit=1,
+            )
+            return dict(zip(res.columns, res.rows[0]))
+        except sqlite3.OperationalError as e:
+            if not _no_aggregates(e):
+                raise
     res = sql_query(
         """
         SELECT
@@ -80,24 +107,24 @@ def get_customer_ticket_stats(customer_id: int) -> Dict[str, Any]:
     row = res.rows[0]
     return dict(zip(res.columns, row))
 
-def similar_tickets_by_keywords(ticket_id: int, k: int = 5) -> List[Dict[str, Any]]:
-    t = get_ticket(ticket_id)
-    text = (t.get("body") or "")[:800].lower()
-    toks = re.findall(r"[a-z]{5,}", text)
-    uniq = []
+def _keywords(text: str, n: int) -> List[str]:
+    toks = re.findall(r"[a-z]{5,}", text[:800].lower())
+    uniq: List[str] = []
     for w in toks:
         if w not in uniq:
             uniq.append(w)
-        if len(uniq) >= 6:
+        if len(uniq) >= n:
             break
+    return uniq
 
-    where = " OR ".join(["lower(body) LIKE ?"] * len(uniq))
-    params: Tuple[Any, ...] = tuple([f"%{w}%" for w in uniq])
+def _similar_tickets_like(ticket_id: int, words: List[str], k: int) -> List[Dict[str, Any]]:
+    where = " OR ".join(["lower(body) LIKE ?"] * len(words))
+    params: Tuple[Any, ...] = tuple([f"%{w}%" for w in words])
 
     res = sql_query(
         f"""
         SELECT id, subject, status, priority, category, created_at,
-               replace(replace(replace(substr(body,1,160), char(10), ' '), char(13), ' '), char(9), ' ') AS preview
+               {PREVIEW_SQL.format(col="body")} AS preview
         FROM tickets
         WHERE id != ? AND ({where})
         ORDER BY created_at DESC
@@ -107,7 +134,310 @@ def similar_tickets_by_keywords(ticket_id: int, k: int = 5) -> List[Dict[str, An
     )
     return [dict(zip(res.columns, r)) for r in res.rows]
 
-def ticket_dashboard_top_categories(limit: int = 10) -> List[Dict[str, Any]]:
+def similar_tickets_by_keywords(
+    ticket_id: int,
+    k: int = 5,
+    ticket: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    t = ticket if ticket is not None else get_ticket(ticket_id)
+    words = _keywords(t.get("body") or "", 12)
+    if not words:
+        return []
+
+    match = " OR ".join(f'"{w}"' for w in words)
+    try:
+        res = sql_query(
+            f"""
+            SELECT t.id, t.subject, t.status, t.priority, t.category, t.created_at,
+                   {PREVIEW_SQL.format(col="t.body")} AS preview
+            FROM tickets_fts
+            JOIN tickets t ON t.id = tickets_fts.rowid
+            WHERE tickets_fts MATCH ? AND tickets_fts.rowid != ?
+            ORDER BY bm25(tickets_fts, 2.0, 1.0)
+            LIMIT ?
+            """,
+            (match, ticket_id, k),
+        )
+    except sqlite3.OperationalError as e:
+        # Databases seeded before tickets_fts existed: fall back to the keyword scan.
+        if "tickets_fts" not in str(e):
+            raise
+        return _similar_tickets_like(ticket_id, words[:6], k)
+    return [dict(zip(res.columns, r)) for r in res.rows]
+
+TICKET_CONTEXT_SQL = """
+SELECT
+  t.id, t.subject, t.body, t.status, t.priority, t.category, t.created_at,
+  c.id AS customer_id, c.name AS customer_name, c.email AS customer_email, c.tier AS customer_tier,
+  s.total_tickets, s.open_tickets, s.closed_tickets, s.high_priority_tickets
+FROM tickets t
+LEFT JOIN customers c ON c.id = t.customer_id
+LEFT JOIN customer_ticket_stats s ON s.customer_id = t.customer_id
+WHERE t.id = :id
+"""
+# Same row with the customer stats aggregated from tickets (live=True, or no summary tables yet).
+TICKET_CONTEXT_LIVE_SQL = """
+SELECT
+  t.id, t.subject, t.body, t.status, t.priority, t.category, t.created_at,
+  c.id AS customer_id, c.name AS customer_name, c.email AS customer_email, c.tier AS customer_tier,
+  s.total_tickets, s.open_tickets, s.closed_tickets, s.high_priority_tickets
+FROM tickets t
+LEFT JOIN customers c ON c.id = t.customer_id
+LEFT JOIN (
+  SELECT
+    customer_id,
+    COUNT(*) AS total_tickets,
+    SUM(CASE WHEN status='open' THEN 1 ELSE 0 END) AS open_tickets,
+    SUM(CASE WHEN status='closed' THEN 1 ELSE 0 END) AS closed_tickets,
+    SUM(CASE WHEN priority IN ('high','urgent') THEN 1 ELSE 0 END) AS high_priority_tickets
+  FROM tickets
+  WHERE customer_id = (SELECT customer_id FROM tickets WHERE id = :id)
+) s ON s.customer_id = t.customer_id
+WHERE t.id = :id
+"""
+STATS_COLUMNS = ("total_tickets", "open_tickets", "closed_tickets", "high_priority_tickets")
+
+CONTEXT_CACHE_SIZE = 1024
+CONTEXT_CACHE_TTL_S = 300.0
+_ctx_cache: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_ctx_by_customer: Dict[int, Set[int]] = {}
+_ctx_lock = threading.Lock()
+# Bumped by every invalidation; a context loaded before a newer invalidation is returned but not cached.
+_ctx_generation = 0
+
+def load_ticket_context(ticket_id: int, n_orders: int = 5, k_similar: int = 5, live: bool = False) -> Dict[str, Any]:
+    """Ticket, customer, stats, recent orders and similar tickets from one connection and read snapshot."""
+    conn = get_conn(readonly=True)
+    conn.execute("BEGIN")
+    try:
+        try:
+            row = conn.execute(TICKET_CONTEXT_LIVE_SQL if live else TICKET_CONTEXT_SQL, {"id": ticket_id}).fetchone()
+        except sqlite3.OperationalError as e:
+            if not _no_aggregates(e):
+                raise
+            row = conn.execute(TICKET_CONTEXT_LIVE_SQL, {"id": ticket_id}).fetchone()
+        if row is None:
+            raise KeyError(f"ticket {ticket_id} not found")
+        full = dict(row)
+        stats = {k: full.pop(k) for k in STATS_COLUMNS}
+        cid = full.get("customer_id")
+        orders = get_customer_recent_orders(cid, n=n_orders) if cid else []
+        sims = similar_tickets_by_keywords(ticket_id, k=k_similar, ticket=full)
+    finally:
+        conn.execute("COMMIT")
+    return {
+        "ticket": full,
+        "customer_stats": stats if cid else {},
+        "recent_orders": orders,
+        "similar_tickets": sims,
+    }
+
+def cached_ticket_context(ticket_id: int) -> Optional[Dict[str, Any]]:
+    with _ctx_lock:
+        hit = _ctx_cache.get(ticket_id)
+        if hit is None or time.monotonic() - hit[0] >= CONTEXT_CACHE_TTL_S:
+            return None
+        _ctx_cache.move_to_end(ticket_id)
+        return deepcopy(hit[1])
+
+def get_ticket_context(ticket_id: int, use_cache: bool = True) -> Dict[str, Any]:
+    if use_cache:
+        hit = cached_ticket_context(ticket_id)
+        if hit is not None:
+            return hit
+    now = time.monotonic()
+    with _ctx_lock:
+        generation = _ctx_generation
+    ctx = load_ticket_context(ticket_id)
+    cid = ctx["ticket"].get("customer_id")
+    with _ctx_lock:
+        if generation != _ctx_generation:
+            return deepcopy(ctx)
+        _ctx_cache[ticket_id] = (now, ctx)
+        _ctx_cache.move_to_end(ticket_id)
+        if cid:
+            _ctx_by_customer.setdefault(cid, set()).add(ticket_id)
+        while len(_ctx_cache) > CONTEXT_CACHE_SIZE:
+            old_id, (_, old) = _ctx_cache.popitem(last=False)
+            _forget_customer_link(old["ticket"].get("customer_id"), old_id)
+    return deepcopy(ctx)
+
+def _forget_customer_link(customer_id: Optional[int], ticket_id: int) -> None:
+    # Caller holds _ctx_lock.
+    tids = _ctx_by_customer.get(customer_id) if customer_id else None
+    if tids is not None:
+        tids.discard(ticket_id)
+        if not tids:
+            del _ctx_by_customer[customer_id]
+
+def invalidate_ticket_context(ticket_id: Optional[int] = None, customer_id: Optional[int] = None) -> None:
+    """Drop cached contexts touched by a write to a ticket (and its customer's other tickets) or a customer's orders."""
+    global _ctx_generation
+    with _ctx_lock:
+        _ctx_generation += 1
+        if ticket_id is not None:
+            hit = _ctx_cache.pop(ticket_id, None)
+            if hit is not None:
+                cached_cid = hit[1]["ticket"].get("customer_id")
+                _forget_customer_link(cached_cid, ticket_id)
+                if customer_id is None:
+                    customer_id = cached_cid
+        if customer_id is not None:
+            for tid in _ctx_by_customer.pop(customer_id, set()):
+                _ctx_cache.pop(tid, None)
+
+def clear_ticket_context_cache() -> None:
+    global _ctx_generation
+    with _ctx_lock:
+        _ctx_generation += 1
+        _ctx_cache.clear()
+        _ctx_by_customer.clear()
+
+def get_tickets_by_ids(ticket_ids: List[int]) -> List[Dict[str, Any]]:
+    if not ticket_ids:
+        return []
+    marks = ",".join("?" * len(ticket_ids))
+    res = sql_query(
+        f"""
+        SELECT id, subject, status, priority, category, created_at,
+               {PREVIEW_SQL.format(col="body")} AS preview
+        FROM tickets
+        WHERE id IN ({marks})
+        """,
+        tuple(ticket_ids),
+        limit=len(ticket_ids),
+    )
+    by_id = {r[0]: dict(zip(res.columns, r)) for r in res.rows}
+    return [by_id[i] for i in ticket_ids if i in by_id]
+
+# Index set for the query shapes in this module and app/api.py; mirrored in db/schema.sql and
+# checked by scr/test_query_plans.py. The ticket-list indexes are covering for the id page.
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_tickets_customer_status ON tickets(customer_id, status, priority);
+CREATE INDEX IF NOT EXISTS idx_tickets_created ON tickets(created_at, id, status, priority, category, customer_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_status_created ON tickets(status, created_at, id, priority, category, customer_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_category_created ON tickets(category, created_at, id, status, priority, customer_id);
+CREATE INDEX IF NOT EXISTS idx_customers_tier ON customers(tier, id);
+CREATE INDEX IF NOT EXISTS idx_orders_customer_created ON orders(customer_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_ticket_events_ticket ON ticket_events(ticket_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_tool_calls_run ON tool_calls(agent_run_id);
+"""
+# Prefixes of the composite indexes above; they only cost writes once those exist.
+SUPERSEDED_INDEXES = ("idx_tickets_customer", "idx_orders_customer")
+TICKET_PAGE_MAX = 500
+TICKET_FILTERS = ("status", "priority", "category")
+
+def ensure_indexes(db_path: Optional[Path] = None) -> None:
+    # Databases seeded before the current index set get it on startup.
+    with transaction(db_path) as conn:
+        conn.executescript(INDEXES)
+        for name in SUPERSEDED_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+def encode_cursor(created_at: str, ticket_id: int) -> str:
+    raw = json.dumps([created_at, ticket_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        created_at, ticket_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(created_at), int(ticket_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"invalid cursor {cursor!r}") from e
+
+def list_tickets_page(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    tier: Optional[str] = None,
+    **filters: Optional[str],
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Newest tickets first, keyset-paginated on (created_at, id); returns the page and the cursor of the next one.
+
+    `filters` may hold status, priority and category. Tickets without created_at are not listed.
+    """
+    limit = max(1, min(int(limit), TICKET_PAGE_MAX))
+    where = ["t.created_at IS NOT NULL"]
+    params: List[Any] = []
+    for col in TICKET_FILTERS:
+        if filters.get(col) is not None:
+            where.append(f"t.{col} = ?")
+            params.append(filters[col])
+    if tier is not None:
+        # Unary + keeps the planner on the ordered covering index instead of idx_tickets_customer plus a sort.
+        where.append("+t.customer_id IN (SELECT id FROM customers WHERE tier = ?)")
+        params.append(tier)
+    if cursor:
+        where.append("(t.created_at, t.id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    res = sql_query(
+        f"""
+        SELECT t.id, t.subject, t.status, t.priority, t.category, t.created_at,
+               c.name AS customer_name, c.tier AS customer_tier
+        FROM (
+          SELECT t.id
+          FROM tickets t
+          WHERE {" AND ".join(where)}
+          ORDER BY t.created_at DESC, t.id DESC
+          LIMIT ?
+        ) page
+        JOIN tickets t ON t.id = page.id
+        LEFT JOIN customers c ON c.id = t.customer_id
+        """,
+        tuple(params) + (limit + 1,),
+        limit=limit + 1,
+    )
+    rows = sorted((dict(zip(res.columns, r)) for r in res.rows), key=lambda r: (r["created_at"], r["id"]), reverse=True)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+def ticket_list_version() -> Optional[int]:
+    """Counter the triggers bump on every write that can change a list_tickets_page result; None if the table is missing."""
+    try:
+        res = sql_query("SELECT COALESCE(MAX(version), 0) FROM ticket_list_version", (), limit=1)
+    except sqlite3.OperationalError as e:
+        if not _no_aggregates(e):
+            raise
+        return None
+    return int(res.rows[0][0])
+
+def iter_ticket_texts(after_id: int = 0, batch_size: int = 512) -> Iterator[List[Tuple[int, str]]]:
+    last = after_id
+    while True:
+        res = sql_query(
+            """
+            SELECT id, COALESCE(subject, '') || char(10) || body AS text
+            FROM tickets
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+            """,
+            (last, batch_size),
+            limit=batch_size,
+        )
+        if not res.rows:
+            return
+        yield [(int(r[0]), r[1]) for r in res.rows]
+        last = int(res.rows[-1][0])
+
+def ticket_dashboard_top_categories(limit: int = 10, live: bool = False) -> List[Dict[str, Any]]:
+    """Largest categories with their open share, from category_ticket_stats; live=True aggregates tickets instead."""
+    if not live:
+        try:
+            res = sql_query(
+                """
+                SELECT category, n, ROUND(100.0 * open_tickets / n, 1) AS open_pct
+                FROM category_ticket_stats
+                ORDER BY n DESC
+                LIMIT ?
+                """,
+                (limit,),
+            )
+            return [dict(zip(res.columns, r)) for r in res.rows]
+        except sqlite3.OperationalError as e:
+            if not _no_aggregates(e):
+                raise
     res = sql_query(
         """
         SELECT
@@ -123,15 +453,15 @@ def ticket_dashboard_top_categories(limit: int = 10) -> List[Dict[str, Any]]:
     )
     return [dict(zip(res.columns, r)) for r in res.rows]
 
+INSERT_TICKET_EVENT_SQL = "INSERT INTO ticket_events(ticket_id, event_type, payload_json) VALUES (?, ?, ?)"
+
 def insert_ticket_event(ticket_id: int, event_type: str, payload: Dict[str, Any]) -> None:
-    conn = _connect()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO ticket_events(ticket_id, event_type, payload_json)
-        VALUES (?, ?, ?)
-        """,
-        (ticket_id, event_type, json.dumps(payload, ensure_ascii=False)),
-    )
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    params = (ticket_id, event_type, json.dumps(payload, ensure_ascii=False))
+    # AGENT_* events only annotate the ticket and change nothing the cached context holds, so they can
+    # go through the write-behind queue. Other events are committed first, then invalidate the cache.
+    if event_type.startswith("AGENT_"):
+        get_trace_writer().submit(INSERT_TICKET_EVENT_SQL, params)
+        return
+    with transaction() as conn:
+        conn.execute(INSERT_TICKET_EVENT_SQL, params)
+    invalidate_ticket_context(ticket_id)
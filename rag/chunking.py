@@ -0,0 +1,76 @@
+from __future__ import annotations
+import hashlib
+import os
+import re
+from collections import deque
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Kept free of faiss/torch imports: rag/ingest.py runs prepare_doc in spawned worker processes.
+DOC_PATTERNS = ("*.md", "*.txt")
+IN_FLIGHT_PER_WORKER = 8
+
+def clean_text(s: str) -> str:
+    s = s.replace("\r", "\n")
+    s = re.sub(r"\n{3,}", "\n\n", s)
+    s = re.sub(r"[ \t]{2,}", " ", s)
+    return s.strip()
+
+def chunk_text(text: str, chunk_size: int = 650, overlap: int = 120) -> List[str]:
+    text = clean_text(text)
+    chunks = []
+    i = 0
+    while i < len(text):
+        j = min(len(text), i + chunk_size)
+        chunk = text[i:j].strip()
+        if chunk:
+            chunks.append(chunk)
+        if j == len(text):
+            break
+        i = max(j - overlap, i + 1)
+    return chunks
+
+def content_hash(raw: str) -> str:
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def doc_title(path: Path, raw: str) -> str:
+    return raw.splitlines()[0].lstrip("# ").strip() if raw.strip() else path.stem
+
+def iter_doc_paths(root: Path, patterns: Tuple[str, ...] = DOC_PATTERNS) -> Iterator[Path]:
+    """Documents under root in a stable order, yielded while the tree is walked."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if any(fnmatch(name, p) for p in patterns):
+                yield Path(dirpath) / name
+
+@dataclass
+class PreparedDoc:
+    doc_id: str
+    sha256: str
+    title: str = ""
+    chunks: Optional[List[str]] = None  # None when the content hash matched the manifest
+
+def prepare_doc(path: Path, doc_id: str, prev_sha256: Optional[str] = None) -> PreparedDoc:
+    raw = path.read_text(encoding="utf-8")
+    digest = content_hash(raw)
+    if digest == prev_sha256:
+        return PreparedDoc(doc_id, digest)
+    return PreparedDoc(doc_id, digest, doc_title(path, raw), chunk_text(raw))
+
+def prepare_docs(tasks: Iterable[Tuple[Path, str, Optional[str]]], pool: Optional[Executor], workers: int = 1) -> Iterator[PreparedDoc]:
+    """prepare_doc over tasks in order; with a pool, at most IN_FLIGHT_PER_WORKER documents per worker are pending."""
+    if pool is None:
+        for t in tasks:
+            yield prepare_doc(*t)
+        return
+    window: "deque" = deque()
+    for t in tasks:
+        window.append(pool.submit(prepare_doc, *t))
+        if len(window) >= workers * IN_FLIGHT_PER_WORKER:
+            yield window.popleft().result()
+    while window:
+        yield window.popleft().result()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+import hashlib
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+def normalize_query(text: str) -> str:
+    # all-MiniLM-L6-v2 uses an uncased tokenizer, so case folding does not change the embedding.
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def cache_key(text: str, model_name: str) -> str:
+    return hashlib.sha1(f"{model_name}\0{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Bounded in-memory LRU of query embeddings with an optional SQLite tier that survives restarts."""
+
+    def __init__(self, model_name: str, max_items: int = 4096, path: Optional[Path] = None):
+        self.model_name = model_name
+        self.max_items = max_items
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                  key   TEXT PRIMARY KEY,
+                  model TEXT NOT NULL,
+                  dim   INTEGER NOT NULL,
+                  vec   BLOB NOT NULL
+                )
+                """
+            )
+            self._conn.commit()
+
+    def _remember(self, key: str, vec: np.ndarray) -> None:
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    def _get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        with self._lock:
+            for key in keys:
+                vec = self._lru.get(key)
+                if vec is None:
+                    missing.append(key)
+                else:
+                    self._lru.move_to_end(key)
+                    found[key] = vec
+            self.hits += len(found)
+            if self._conn is not None and missing:
+                marks = ",".join("?" * len(missing))
+                rows = self._conn.execute(
+                    f"SELECT key, dim, vec FROM embeddings WHERE key IN ({marks})",
+                    tuple(missing),
+                ).fetchall()
+                for key, dim, blob in rows:
+                    vec = np.frombuffer(blob, dtype="float32").reshape(dim)
+                    self._remember(key, vec)
+                    found[key] = vec
+                self.disk_hits += len(rows)
+            self.misses += len(set(keys) - set(found))
+        return found
+
+    def _put_many(self, items: Dict[str, np.ndarray]) -> None:
+        with self._lock:
+            for key, vec in items.items():
+                self._remember(key, vec)
+            if self._conn is not None and items:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings(key, model, dim, vec) VALUES (?, ?, ?, ?)",
+                    [(k, self.model_name, int(v.shape[0]), v.tobytes()) for k, v in items.items()],
+                )
+                self._conn.commit()
+
+    def encode(self, texts: List[str], encoder: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        keys = [cache_key(t, self.model_name) for t in texts]
+        found = self._get_many(keys)
+        todo: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in todo:
+                todo[key] = text
+        if todo:
+            emb = encoder(list(todo.values())).astype("float32")
+            fresh = {key: np.ascontiguousarray(emb[i]) for i, key in enumerate(todo)}
+            self._put_many(fresh)
+            found.update(fresh)
+        return np.vstack([found[key] for key in keys])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "size": len(self._lru),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embeddings WHERE model = ?", (self.model_name,))
+                self._conn.commit()
@@ -0,0 +1,83 @@
+from __future__ import annotations
+import json
+import math
+from dataclasses import dataclass, asdict, replace
+from pathlib import Path
+from typing import Any, Dict, Optional
+import faiss
+import numpy as np
+
+INDEX_KINDS = ("flat", "ivf", "hnsw", "pq", "sq8")
+
+@dataclass
+class IndexSpec:
+    """How the RAG index is built and searched; persisted next to the index file."""
+
+    kind: str = "flat"
+    nlist: int = 100
+    nprobe: int = 8
+    hnsw_m: int = 32
+    ef_search: int = 64
+    pq_m: int = 16
+    pq_nbits: int = 8
+
+    def __post_init__(self):
+        if self.kind not in INDEX_KINDS:
+            raise ValueError(f"unknown index kind {self.kind!r}; expected one of {INDEX_KINDS}")
+
+    @property
+    def trained(self) -> bool:
+        return self.kind in ("ivf", "pq", "sq8")
+
+    @property
+    def supports_remove(self) -> bool:
+        return self.kind != "hnsw"
+
+    def build_key(self) -> tuple:
+        return (self.kind, self.nlist, self.hnsw_m, self.pq_m, self.pq_nbits)
+
+    def fit(self, n_train: int) -> "IndexSpec":
+        # Clamp training-dependent sizes so small corpora still build (faiss wants ~39 points per centroid).
+        nlist = max(1, min(self.nlist, n_train // 39))
+        nbits = max(1, min(self.pq_nbits, int(math.log2(max(n_train, 2)))))
+        return replace(self, nlist=nlist, pq_nbits=nbits)
+
+    def factory_string(self) -> str:
+        return {
+            "flat": "Flat",
+            "ivf": f"IVF{self.nlist},Flat",
+            "hnsw": f"HNSW{self.hnsw_m}",
+            "pq": f"IVF{self.nlist},PQ{self.pq_m}x{self.pq_nbits}",
+            "sq8": "SQ8",
+        }[self.kind]
+
+    def build(self, dim: int, train: Optional[np.ndarray] = None):
+        index = faiss.IndexIDMap2(faiss.index_factory(dim, self.factory_string(), faiss.METRIC_INNER_PRODUCT))
+        if self.trained:
+            if train is None or len(train) == 0:
+                raise ValueError(f"{self.kind} index needs training vectors")
+            index.train(train)
+        return index
+
+    def apply_search_params(self, index) -> None:
+        ps = faiss.ParameterSpace()
+        if self.kind in ("ivf", "pq"):
+            ps.set_index_parameter(index, "nprobe", self.nprobe)
+        elif self.kind == "hnsw":
+            ps.set_index_parameter(index, "efSearch", self.ef_search)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "IndexSpec":
+        return cls(**{k: v for k, v in d.items() if k in cls.__dataclass_fields__})
+
+    def save(self, path: Path) -> None:
+        path.write_text(json.dumps(self.to_dict(), indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "IndexSpec":
+        if not path.exists():
+            return cls()
+        return cls.from_dict(json.loads(path.read_text(encoding="utf-8")))
@@ -1,71 +1,283 @@
 from __future__ import annotations
+import argparse
 import json
-import re
-from dataclasses import dataclass
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, replace
 from pathlib import Path
-from typing import List, Dict, Any
-import faiss
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
+import numpy as np
+from rag.chunking import iter_doc_paths, prepare_docs
+from rag.meta_store import MetaStoreWriter
+
+# faiss, sentence_transformers/torch and rag.search are imported inside the functions that need them:
+# `python -m rag.ingest` re-imports this module as __mp_main__ in every spawned chunking worker.
+if TYPE_CHECKING:
+    from rag.index_spec import IndexSpec
+    from rag.search import Meta
 
 DOC_DIR = Path("dat/docs")
 OUT_DIR = Path("dat/out")
 INDEX_PATH = OUT_DIR / "rag.faiss"
-META_PATH = OUT_DIR / "rag_meta.jsonl"
+META_PATH = OUT_DIR / "rag_meta.bin"
+MANIFEST_PATH = OUT_DIR / "rag_manifest.json"
+INDEX_SPEC_PATH = OUT_DIR / "rag_index.json"
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-
-def clean_text(s: str) -> str:
-    s = s.replace("\r", "\n")
-    s = re.sub(r"\n{3,}", "\n\n", s)
-    s = re.sub(r"[ \t]{2,}", " ", s)
-    return s.strip()
-
-def chunk_text(text: str, chunk_size: int = 650, overlap: int = 120) -> List[str]:
-    text = clean_text(text)
-    chunks = []
-    i = 0
-    while i < len(text):
-        j = min(len(text), i + chunk_size)
-        chunk = text[i:j].strip()
-        if chunk:
-            chunks.append(chunk)
-        i = max(j - overlap, i + 1)
-    return chunks
+DEFAULT_WORKERS = 2       # chunking is cheap next to encoding; a couple of processes keep the encoder fed
+ENCODE_BATCH = 256        # chunks per model.encode call and per index/metadata append
+TRAIN_MAX = 65_536        # vectors buffered to train a fresh ivf/pq/sq8 index before streaming the rest
+PROGRESS_EVERY = 1000     # documents between progress lines
 
 @dataclass
 class ChunkMeta:
+    id: int
     doc_id: str
     doc_title: str
     chunk_id: int
     text: str
 
-def main():
+def _load_manifest() -> Dict[str, Any]:
+    if not MANIFEST_PATH.exists():
+        return {}
+    return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+
+def _write_atomic(path: Path, write) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+def _save(
+    index,
+    writer: MetaStoreWriter,
+    old_meta: Optional[Meta],
+    kept: np.ndarray,
+    manifest: Dict[str, Any],
+    spec: IndexSpec,
+) -> None:
+    import faiss
+    from rag.search import LEGACY_META_PATH
+
+    _write_atomic(INDEX_PATH, lambda p: faiss.write_index(index, str(p)))
+    for cid in kept.tolist():
+        writer.add(old_meta[cid])
+    writer.close()
+    _write_atomic(INDEX_SPEC_PATH, spec.save)
+    _write_atomic(MANIFEST_PATH, lambda p: p.write_text(json.dumps(manifest, indent=2), encoding="utf-8"))
+    LEGACY_META_PATH.unlink(missing_ok=True)
+
+def _open_existing(manifest: Dict[str, Any], spec: IndexSpec):
+    import faiss
+    from rag.index_spec import IndexSpec
+    from rag.search import check_consistency, open_meta
+
+    if manifest.get("model") != MODEL_NAME or not INDEX_PATH.exists():
+        return None
+    requested = IndexSpec.from_dict(manifest.get("index_request", {}))
+    if requested.build_key() != spec.build_key():
+        print(f"index spec changed ({requested.factory_string()} -> {spec.factory_string()}); rebuilding")
+        return None
+    built = replace(IndexSpec.from_dict(manifest.get("index", {})), nprobe=spec.nprobe, ef_search=spec.ef_search)
+    index = faiss.read_index(str(INDEX_PATH))
+    if not hasattr(index, "id_map"):
+        return None
+    meta = open_meta(META_PATH)
+    try:
+        check_consistency(index, meta)
+    except RuntimeError as e:
+        print(f"{e}; rebuilding")
+        return None
+    return index, meta, built
+
+def _rebuild(spec: IndexSpec, dim: int, vectors: np.ndarray, ids: np.ndarray):
+    fitted = spec.fit(len(vectors))
+    index = fitted.build(dim, train=vectors)
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    return index, fitted
+
+class IndexSink:
+    """Takes vectors batch by batch. A fresh index of a trained kind buffers up to TRAIN_MAX vectors, trains on
+    them and then appends directly; untrained kinds and existing indexes append from the first batch."""
+
+    def __init__(self, spec: IndexSpec, dim: int, index=None):
+        self.spec = spec
+        self.dim = dim
+        self.index = index
+        self._ids: List[np.ndarray] = []
+        self._vecs: List[np.ndarray] = []
+        self._buffered = 0
+
+    def add(self, ids: np.ndarray, vecs: np.ndarray) -> None:
+        if self.index is not None:
+            self.index.add_with_ids(vecs, ids)
+            return
+        self._ids.append(ids)
+        self._vecs.append(vecs)
+        self._buffered += len(ids)
+        if not self.spec.trained or self._buffered >= TRAIN_MAX:
+            self._build()
+
+    def _build(self) -> None:
+        vecs = np.vstack(self._vecs) if self._vecs else np.zeros((0, self.dim), dtype="float32")
+        ids = np.concatenate(self._ids) if self._ids else np.zeros(0, dtype="int64")
+        self.index, self.spec = _rebuild(self.spec, self.dim, vecs, ids)
+        self._ids, self._vecs, self._buffered = [], [], 0
+
+    def finish(self) -> Tuple[Any, IndexSpec]:
+        if self.index is None:
+            self._build()
+        return self.index, self.spec
+
+def main(
+    full: bool = False,
+    spec: Optional[IndexSpec] = None,
+    doc_dir: Path = DOC_DIR,
+    workers: int = 1,
+    batch_size: int = ENCODE_BATCH,
+) -> None:
+    from rag.index_spec import IndexSpec
+
+    spec = spec or IndexSpec()
     OUT_DIR.mkdir(parents=True, exist_ok=True)
-    md_files = sorted(DOC_DIR.glob("*.md"))
+    # Spawned before the model is loaded. Each worker imports this module's light top level and rag.chunking.
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) if workers > 1 else None
+    try:
+        _ingest(full, spec, doc_dir, pool, workers, batch_size)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+def _ingest(full: bool, spec: IndexSpec, doc_dir: Path, pool, workers: int, batch_size: int) -> None:
+    from sentence_transformers import SentenceTransformer
+    from rag.search import check_ids, meta_ids
+
     model = SentenceTransformer(MODEL_NAME)
+    dim = model.get_sentence_embedding_dimension()
+
+    manifest = {} if full else _load_manifest()
+    existing = None if full else _open_existing(manifest, spec)
+    if existing is None:
+        index = None
+        old_meta: Optional[Meta] = None
+        manifest = {"model": MODEL_NAME, "next_id": 0, "docs": {}}
+        built = spec
+    else:
+        index, old_meta, built = existing
+
+    docs: Dict[str, Dict[str, Any]] = manifest["docs"]
+    next_id = int(manifest["next_id"])
+    seen = set()
+    stale: List[int] = []
+    added: List[int] = []
+    sink = IndexSink(built, dim, index)
+    writer = MetaStoreWriter(META_PATH)
+    batch: List[ChunkMeta] = []
+
+    def flush() -> None:
+        emb = model.encode(
+            [c.text for c in batch], batch_size=batch_size, normalize_embeddings=True, convert_to_numpy=True
+        ).astype("float32")
+        ids = np.asarray([c.id for c in batch], dtype="int64")
+        sink.add(ids, emb)
+        for c in batch:
+            writer.add(asdict(c))
+        added.extend(ids.tolist())
+        batch.clear()
+
+    started = time.perf_counter()
+    tasks = (
+        (path, rel, docs.get(rel, {}).get("sha256"))
+        for path in iter_doc_paths(doc_dir)
+        for rel in [path.relative_to(doc_dir).as_posix()]
+    )
+    for doc in prepare_docs(tasks, pool, workers):
+        seen.add(doc.doc_id)
+        if len(seen) % PROGRESS_EVERY == 0:
+            _report("  ", len(seen), len(added) + len(batch), time.perf_counter() - started)
+        if doc.chunks is None:
+            continue
+        prev = docs.get(doc.doc_id)
+        if prev is not None:
+            stale.extend(prev["ids"])
+        ids = []
+        for idx, ch in enumerate(doc.chunks):
+            batch.append(ChunkMeta(id=next_id, doc_id=doc.doc_id, doc_title=doc.title, chunk_id=idx, text=ch))
+            ids.append(next_id)
+            next_id += 1
+            if len(batch) >= batch_size:
+                flush()
+        docs[doc.doc_id] = {"sha256": doc.sha256, "title": doc.title, "ids": ids}
+    if batch:
+        flush()
+    elapsed = time.perf_counter() - started
+
+    for name in sorted(set(docs) - seen):
+        stale.extend(docs.pop(name)["ids"])
+
+    kept = np.zeros(0, dtype="int64")
+    if old_meta is not None:
+        kept = np.setdiff1d(meta_ids(old_meta), np.asarray(stale, dtype="int64"))
+    new_ids = np.asarray(added, dtype="int64")
+    index, built = sink.finish()
+    if stale and not built.supports_remove:
+        live = np.concatenate([kept, new_ids])
+        vecs = np.vstack([index.reconstruct(int(i)) for i in live]).astype("float32") if len(live) else np.zeros((0, dim), dtype="float32")
+        index, built = _rebuild(spec, dim, vecs, live)
+    elif stale:
+        index.remove_ids(np.asarray(stale, dtype="int64"))
+
+    manifest["next_id"] = next_id
+    params_changed = manifest.get("index") != built.to_dict()
+    manifest["index"] = built.to_dict()
+    manifest["index_request"] = spec.to_dict()
+    check_ids(index, np.concatenate([kept, new_ids]))
+    if stale or added or existing is None or params_changed:
+        _save(index, writer, old_meta, kept, manifest, built)
+    else:
+        writer.discard()
+    print(
+        f"index: {built.factory_string()} docs: {len(docs)} added_chunks: {len(added)} "
+        f"removed_chunks: {len(stale)} total_chunks: {index.ntotal}"
+    )
+    _report("", len(seen), len(added), elapsed)
+
+def _report(prefix: str, n_docs: int, n_chunks: int, elapsed: float) -> None:
+    elapsed = max(elapsed, 1e-9)
+    print(f"{prefix}{n_docs} docs, {n_chunks} chunks embedded in {elapsed:.1f}s ({n_docs / elapsed:.1f} docs/s, {n_chunks / elapsed:.1f} chunks/s)")
+
+def spec_from_args(args: argparse.Namespace) -> IndexSpec:
+    from rag.index_spec import IndexSpec
+
+    return IndexSpec(
+        kind=args.index,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        hnsw_m=args.hnsw_m,
+        ef_search=args.ef_search,
+        pq_m=args.pq_m,
+        pq_nbits=args.pq_nbits,
+    )
+
+def add_index_args(ap: argparse.ArgumentParser) -> None:
+    from rag.index_spec import INDEX_KINDS, IndexSpec
 
-    all_chunks: List[ChunkMeta] = []
-    for f in md_files:
-        raw = f.read_text(encoding="utf-8")
-        title = raw.splitlines()[0].lstrip("# ").strip() if raw.strip() else f.stem
-        chunks = chunk_text(raw)
-        for idx, ch in enumerate(chunks):
-            all_chunks.append(ChunkMeta(doc_id=f.name, doc_title=title, chunk_id=idx, text=ch))
-
-    texts = [c.text for c in all_chunks]
-    emb = model.encode(texts, normalize_embeddings=True).astype("float32")
-
-    index = faiss.IndexFlatIP(emb.shape[1])
-    index.add(emb)
-    faiss.write_index(index, str(INDEX_PATH))
-
-    with META_PATH.open("w", encoding="utf-8") as w:
-        for c in all_chunks:
-            w.write(json.dumps({
-                "doc_id": c.doc_id,
-                "doc_title": c.doc_title,
-                "chunk_id": c.chunk_id,
-                "text": c.text
-            }, ensure_ascii=False) + "\n")
+    d = IndexSpec()
+    ap.add_argument("--index", choices=INDEX_KINDS, default=d.kind, help="FAISS index type")
+    ap.add_argument("--nlist", type=int, default=d.nlist, help="IVF/PQ: number of inverted lists")
+    ap.add_argument("--nprobe", type=int, default=d.nprobe, help="IVF/PQ: lists probed per query")
+    ap.add_argument("--hnsw-m", type=int, default=d.hnsw_m, help="HNSW: neighbours per node")
+    ap.add_argument("--ef-search", type=int, default=d.ef_search, help="HNSW: search beam width")
+    ap.add_argument("--pq-m", type=int, default=d.pq_m, help="PQ: sub-quantizers (must divide the embedding dim)")
+    ap.add_argument("--pq-nbits", type=int, default=d.pq_nbits, help="PQ: bits per sub-quantizer code")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    ap = argparse.ArgumentParser(description="Build or incrementally update the RAG index.")
+    ap.add_argument("--full", action="store_true", help="ignore the manifest and rebuild from scratch")
+    ap.add_argument("--docs", type=Path, default=DOC_DIR, help="directory tree of .md/.txt documents")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="processes reading and chunking documents")
+    ap.add_argument("--batch-size", type=int, default=ENCODE_BATCH, help="chunks per embedding batch")
+    add_index_args(ap)
+    args = ap.parse_args()
+    main(full=args.full, spec=spec_from_args(args), doc_dir=args.docs, workers=args.workers, batch_size=args.batch_size)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+import numpy as np
+
+# Layout: header | slot table (one record per FAISS id) | JSON list of distinct doc ids/titles | UTF-8 text blob.
+MAGIC = b"RAGM"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQQ")
+SLOT_DTYPE = np.dtype([
+    ("text_off", "<i8"),
+    ("text_len", "<u4"),
+    ("doc", "<u4"),
+    ("title", "<u4"),
+    ("chunk_id", "<u4"),
+])
+
+class MetaStore:
+    """Read-only, memory-mapped chunk metadata indexed directly by FAISS id."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._f = path.open("rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_slots, strings_len, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a v{VERSION} RAG metadata store")
+        slots_off = HEADER.size
+        strings_off = slots_off + n_slots * SLOT_DTYPE.itemsize
+        self._slots = np.frombuffer(self._mm, dtype=SLOT_DTYPE, count=n_slots, offset=slots_off)
+        self._strings: List[str] = json.loads(self._mm[strings_off:strings_off + strings_len].decode("utf-8"))
+        self._blob_off = strings_off + strings_len
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._slots["text_off"] >= 0))
+
+    def __contains__(self, cid: object) -> bool:
+        return isinstance(cid, (int, np.integer)) and 0 <= cid < len(self._slots) and self._slots[cid]["text_off"] >= 0
+
+    def __getitem__(self, cid: int) -> Dict[str, Any]:
+        if cid not in self:
+            raise KeyError(cid)
+        s = self._slots[cid]
+        start = self._blob_off + int(s["text_off"])
+        return {
+            "id": int(cid),
+            "doc_id": self._strings[s["doc"]],
+            "doc_title": self._strings[s["title"]],
+            "chunk_id": int(s["chunk_id"]),
+            "text": self._mm[start:start + int(s["text_len"])].decode("utf-8"),
+        }
+
+    def ids(self) -> np.ndarray:
+        return np.flatnonzero(self._slots["text_off"] >= 0).astype("int64")
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids().tolist())
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        for cid in self:
+            yield self[cid]
+
+    def close(self) -> None:
+        self._slots = None
+        self._mm.close()
+        self._f.close()
+
+class MetaStoreWriter:
+    """Streams chunk records into a MetaStore file; slots and strings stay in memory, text is spooled to disk."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._slots: Dict[int, tuple] = {}
+        self._strings: Dict[str, int] = {}
+        self._blob = tempfile.TemporaryFile()
+        self._blob_len = 0
+
+    def _intern(self, s: str) -> int:
+        if s not in self._strings:
+            self._strings[s] = len(self._strings)
+        return self._strings[s]
+
+    def add(self, m: Dict[str, Any]) -> None:
+        data = m["text"].encode("utf-8")
+        self._slots[int(m["id"])] = (
+            self._blob_len,
+            len(data),
+            self._intern(m["doc_id"]),
+            self._intern(m["doc_title"]),
+            int(m["chunk_id"]),
+        )
+        self._blob.write(data)
+        self._blob_len += len(data)
+
+    def close(self) -> None:
+        n_slots = max(self._slots) + 1 if self._slots else 0
+        slots = np.zeros(n_slots, dtype=SLOT_DTYPE)
+        slots["text_off"] = -1
+        for cid, rec in self._slots.items():
+            slots[cid] = rec
+        strings = json.dumps(list(self._strings), ensure_ascii=False).encode("utf-8")
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("wb") as w:
+            w.write(HEADER.pack(MAGIC, VERSION, n_slots, len(strings), self._blob_len))
+            w.write(slots.tobytes())
+            w.write(strings)
+            self._blob.seek(0)
+            shutil.copyfileobj(self._blob, w)
+        self._blob.close()
+        os.replace(tmp, self.path)
+
+    def discard(self) -> None:
+        self._blob.close()
@@ -1,15 +1,25 @@
 from __future__ import annotations
 import json
+import os
+import threading
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union
 import faiss
+import numpy as np
 from sentence_transformers import SentenceTransformer
+from agt.metrics import RAG_SECONDS, observe_seconds
+from rag.embed_cache import EmbeddingCache
+from rag.index_spec import IndexSpec
+from rag.meta_store import MetaStore
 
 OUT_DIR = Path("dat/out")
 INDEX_PATH = OUT_DIR / "rag.faiss"
-META_PATH = OUT_DIR / "rag_meta.jsonl"
+META_PATH = OUT_DIR / "rag_meta.bin"
+LEGACY_META_PATH = OUT_DIR / "rag_meta.jsonl"
+INDEX_SPEC_PATH = OUT_DIR / "rag_index.json"
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_CACHE_SIZE = 4096
 
 @dataclass
 class RAGHit:
@@ -22,22 +32,139 @@ class RAGHit:
     def cite(self) -> str:
         return f"{self.doc_id}#chunk{self.chunk_id} ({self.doc_title})"
 
-def _load_meta() -> List[Dict[str, Any]]:
-    meta = []
-    with META_PATH.open("r", encoding="utf-8") as r:
-        for line in r:
-            meta.append(json.loads(line))
+Meta = Union[MetaStore, Dict[int, Dict[str, Any]]]
+
+def load_meta(meta_path: Path = LEGACY_META_PATH) -> Dict[int, Dict[str, Any]]:
+    meta: Dict[int, Dict[str, Any]] = {}
+    with meta_path.open("r", encoding="utf-8") as r:
+        for pos, line in enumerate(r):
+            m = json.loads(line)
+            meta[int(m.get("id", pos))] = m
     return meta
 
-def search(query: str, k: int = 5) -> List[RAGHit]:
-    index = faiss.read_index(str(INDEX_PATH))
-    meta = _load_meta()
-    model = SentenceTransformer(MODEL_NAME)
-    q = model.encode([query], normalize_embeddings=True).astype("float32")
+def open_meta(meta_path: Path = META_PATH) -> Meta:
+    if meta_path.exists():
+        return MetaStore(meta_path)
+    # Indexes built before the binary store only have rag_meta.jsonl.
+    return load_meta(meta_path.with_name(LEGACY_META_PATH.name))
+
+def meta_ids(meta: Meta) -> np.ndarray:
+    if isinstance(meta, MetaStore):
+        return meta.ids()
+    return np.fromiter(meta.keys(), dtype="int64", count=len(meta))
+
+def index_ids(index) -> np.ndarray:
+    if hasattr(index, "id_map"):
+        return faiss.vector_to_array(index.id_map).astype("int64")
+    return np.arange(index.ntotal, dtype="int64")
+
+def check_ids(index, expected: np.ndarray) -> None:
+    ids = np.sort(index_ids(index))
+    mids = np.sort(expected)
+    if not np.array_equal(ids, mids):
+        raise RuntimeError(
+            f"RAG index/metadata mismatch: {len(ids)} vectors vs {len(mids)} metadata rows; "
+            "re-run `python -m rag.ingest --full`"
+        )
+
+def check_consistency(index, meta: Meta) -> None:
+    check_ids(index, meta_ids(meta))
+
+def read_index(path: Path):
+    # Map the index file instead of copying it into each worker's heap where the index type allows it.
+    try:
+        return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(str(path))
+
+class Retriever:
+    """Owns the FAISS index, chunk metadata and encoder for the lifetime of the process."""
+
+    def __init__(
+        self,
+        index_path: Path = INDEX_PATH,
+        meta_path: Path = META_PATH,
+        spec_path: Path = INDEX_SPEC_PATH,
+        model_name: str = MODEL_NAME,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.index_path = index_path
+        self.meta_path = meta_path
+        self.spec_path = spec_path
+        self.model_name = model_name
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._index = None
+        self._meta: Meta = {}
+        self._model: Optional[SentenceTransformer] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._index is not None and self._model is not None
+
+    def _open(self):
+        index = read_index(self.index_path)
+        IndexSpec.load(self.spec_path).apply_search_params(index)
+        meta = open_meta(self.meta_path)
+        check_consistency(index, meta)
+        return index, meta
+
+    def model(self) -> SentenceTransformer:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def load(self) -> "Retriever":
+        if self.loaded:
+            return self
+        self.model()
+        with self._lock:
+            if self._index is None:
+                self._index, self._meta = self._open()
+        return self
 
-    scores, ids = index.search(q, k)
+    def reload(self) -> "Retriever":
+        index, meta = self._open()
+        with self._lock:
+            self._index, self._meta = index, meta
+        return self.load()
+
+    def dimension(self) -> int:
+        return self.model().get_sentence_embedding_dimension()
+
+    def _encode(self, texts: List[str]):
+        return self.model().encode(texts, normalize_embeddings=True).astype("float32")
+
+    def encode(self, texts: List[str], use_cache: bool = True):
+        if self.cache is None or not use_cache:
+            return self._encode(texts)
+        return self.cache.encode(texts, self._encode)
+
+    def _snapshot(self):
+        self.load()
+        with self._lock:
+            return self._index, self._meta
+
+    def search(self, query: str, k: int = 5) -> List[RAGHit]:
+        return self.search_many([query], k=k)[0]
+
+    def search_many(self, queries: List[str], k: int = 5) -> List[List[RAGHit]]:
+        if not queries:
+            return []
+        index, meta = self._snapshot()
+        with observe_seconds(RAG_SECONDS, phase="encode"):
+            q = self.encode(list(queries))
+        with observe_seconds(RAG_SECONDS, phase="search"):
+            scores, ids = index.search(q, k)
+        return [_to_hits(meta, s_row, i_row) for s_row, i_row in zip(scores, ids)]
+
+def _to_hits(meta: Meta, scores, ids) -> List[RAGHit]:
     hits: List[RAGHit] = []
-    for score, idx in zip(scores[0], ids[0]):
+    for score, idx in zip(scores, ids):
+        if idx < 0:
+            continue
         m = meta[int(idx)]
         hits.append(RAGHit(
             score=float(score),
@@ -48,8 +175,36 @@ def search(query: str, k: int = 5) -> List[RAGHit]:
         ))
     return hits
 
+_RETRIEVER: Optional[Retriever] = None
+_RETRIEVER_LOCK = threading.Lock()
+
+def get_retriever() -> Retriever:
+    global _RETRIEVER
+    if _RETRIEVER is None:
+        with _RETRIEVER_LOCK:
+            if _RETRIEVER is None:
+                disk = os.environ.get("RAG_EMBED_CACHE_PATH")
+                cache = EmbeddingCache(
+                    MODEL_NAME,
+                    max_items=EMBED_CACHE_SIZE,
+                    path=Path(disk) if disk else None,
+                )
+                _RETRIEVER = Retriever(cache=cache)
+    return _RETRIEVER
+
+def warmup() -> Retriever:
+    r = get_retriever().load()
+    r._encode(["warmup"])
+    return r
+
+def search(query: str, k: int = 5) -> List[RAGHit]:
+    return get_retriever().search(query, k=k)
+
+def search_many(queries: List[str], k: int = 5) -> List[List[RAGHit]]:
+    return get_retriever().search_many(queries, k=k)
+
 def format_context(hits: List[RAGHit]) -> str:
     lines = []
     for i, h in enumerate(hits, start=1):
         lines.append(f"[{i}] {h.cite()}\n{h.text}\n")
-    return "\n".join(lines).strip()
\ No newline at end of file
+    return "\n".join(lines).strip()
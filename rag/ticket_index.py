@@ -0,0 +1,106 @@
+from __future__ import annotations
+import argparse
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import faiss
+import numpy as np
+from db.sql_tool import get_tickets_by_ids, iter_ticket_texts
+from rag.search import OUT_DIR, get_retriever
+
+TICKET_INDEX_PATH = OUT_DIR / "tickets.faiss"
+
+class TicketIndex:
+    """Vector index over ticket subject+body, keyed by ticket id and appended to as new tickets arrive."""
+
+    def __init__(self, path: Path = TICKET_INDEX_PATH, batch_size: int = 256):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._index = None
+
+    def _load(self):
+        if self._index is None:
+            if self.path.exists():
+                self._index = faiss.read_index(str(self.path))
+            else:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(get_retriever().dimension()))
+        return self._index
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        faiss.write_index(self._index, str(tmp))
+        os.replace(tmp, self.path)
+
+    def _max_id(self) -> int:
+        if self._index.ntotal == 0:
+            return 0
+        return int(faiss.vector_to_array(self._index.id_map).max())
+
+    def sync(self) -> int:
+        """Embed and append every ticket newer than the last indexed id; returns how many were added."""
+        with self._lock:
+            index = self._load()
+            retriever = get_retriever()
+            added = 0
+            for batch in iter_ticket_texts(after_id=self._max_id(), batch_size=self.batch_size):
+                ids = np.asarray([tid for tid, _ in batch], dtype="int64")
+                emb = retriever.encode([text for _, text in batch], use_cache=False)
+                index.add_with_ids(emb, ids)
+                added += len(batch)
+            if added:
+                self._save()
+            return added
+
+    def rebuild(self) -> int:
+        with self._lock:
+            self._index = None
+            self.path.unlink(missing_ok=True)
+        return self.sync()
+
+    def _vector(self, ticket_id: int) -> Optional[np.ndarray]:
+        try:
+            return self._index.reconstruct(int(ticket_id)).reshape(1, -1)
+        except RuntimeError:
+            return None
+
+    def similar(self, ticket_id: int, k: int = 5) -> List[int]:
+        with self._lock:
+            self._load()
+            known = self._vector(ticket_id) is not None
+        if not known:
+            self.sync()
+        with self._lock:
+            vec = self._vector(ticket_id)
+            if vec is None:
+                return []
+            _, ids = self._index.search(vec, k + 1)
+        return [int(i) for i in ids[0] if i >= 0 and i != ticket_id][:k]
+
+_TICKET_INDEX: Optional[TicketIndex] = None
+_TICKET_INDEX_LOCK = threading.Lock()
+
+def get_ticket_index() -> TicketIndex:
+    global _TICKET_INDEX
+    if _TICKET_INDEX is None:
+        with _TICKET_INDEX_LOCK:
+            if _TICKET_INDEX is None:
+                _TICKET_INDEX = TicketIndex()
+    return _TICKET_INDEX
+
+def similar_tickets_by_embedding(ticket_id: int, k: int = 5) -> List[Dict[str, Any]]:
+    return get_tickets_by_ids(get_ticket_index().similar(ticket_id, k=k))
+
+def main():
+    ap = argparse.ArgumentParser(description="Build or update the ticket similarity index.")
+    ap.add_argument("--rebuild", action="store_true", help="re-embed every ticket instead of appending new ones")
+    ap.add_argument("--batch-size", type=int, default=256)
+    args = ap.parse_args()
+    idx = TicketIndex(batch_size=args.batch_size)
+    added = idx.rebuild() if args.rebuild else idx.sync()
+    print(f"tickets added: {added} total: {idx._index.ntotal}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import time
+import faiss
+import numpy as np
+from rag.index_spec import IndexSpec, INDEX_KINDS
+
+def synthetic_vectors(n: int, dim: int, rng: np.random.Generator, n_clusters: int = 64) -> np.ndarray:
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    x = centers[rng.integers(0, n_clusters, n)] + 0.35 * rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+def corpus_vectors() -> np.ndarray:
+    from rag.search import get_retriever
+    r = get_retriever().load()
+    _, meta = r._snapshot()
+    return r._encode([m["text"] for m in meta.values()])
+
+def percentile(xs, p: float) -> float:
+    return float(np.percentile(np.asarray(xs), p))
+
+def bench(spec: IndexSpec, xb: np.ndarray, xq: np.ndarray, gt: np.ndarray, k: int) -> dict:
+    fitted = spec.fit(len(xb))
+    t0 = time.perf_counter()
+    index = fitted.build(xb.shape[1], train=xb)
+    index.add_with_ids(xb, np.arange(len(xb), dtype="int64"))
+    build_s = time.perf_counter() - t0
+    fitted.apply_search_params(index)
+
+    lat = []
+    found = np.empty_like(gt)
+    for i in range(len(xq)):
+        t = time.perf_counter()
+        _, ids = index.search(xq[i:i + 1], k)
+        lat.append((time.perf_counter() - t) * 1000)
+        found[i] = ids[0]
+    recall = np.mean([len(set(found[i]) & set(gt[i])) / k for i in range(len(xq))])
+    return {
+        "index": fitted.factory_string(),
+        "recall": float(recall),
+        "p50_ms": percentile(lat, 50),
+        "p99_ms": percentile(lat, 99),
+        "bytes": len(faiss.serialize_index(index)),
+        "build_s": build_s,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Recall@k vs latency for the RAG index types.")
+    ap.add_argument("--synthetic", type=int, default=0, help="benchmark N synthetic vectors instead of the RAG corpus")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--kinds", nargs="+", choices=INDEX_KINDS, default=list(INDEX_KINDS))
+    ap.add_argument("--nlist", type=int, default=IndexSpec.nlist)
+    ap.add_argument("--nprobe", type=int, default=IndexSpec.nprobe)
+    ap.add_argument("--ef-search", type=int, default=IndexSpec.ef_search)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    xb = synthetic_vectors(args.synthetic, args.dim, rng) if args.synthetic else corpus_vectors()
+    xq = xb[rng.integers(0, len(xb), args.queries)] + 0.1 * rng.standard_normal((args.queries, xb.shape[1])).astype("float32")
+    faiss.normalize_L2(xq)
+
+    exact = faiss.IndexFlatIP(xb.shape[1])
+    exact.add(xb)
+    _, gt = exact.search(xq, args.k)
+
+    print(f"vectors: {len(xb)} dim: {xb.shape[1]} queries: {len(xq)} k: {args.k}")
+    print(f"{'index':<22}{'recall@k':>10}{'p50_ms':>10}{'p99_ms':>10}{'bytes':>14}{'build_s':>10}")
+    for kind in args.kinds:
+        spec = IndexSpec(kind=kind, nlist=args.nlist, nprobe=args.nprobe, ef_search=args.ef_search)
+        r = bench(spec, xb, xq, gt, args.k)
+        print(f"{r['index']:<22}{r['recall']:>10.3f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['bytes']:>14,}{r['build_s']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import gzip
+import json
+import sqlite3
+from pathlib import Path
+from typing import List, Tuple
+from db.blobs import BLOB_MIN_CHARS, INSERT_BLOB_SQL, SCHEMA as BLOB_SCHEMA, encode_payload, hydrate_json, referenced_hashes
+from db.conn import DB_PATH, connect
+
+BATCH = 500
+BLOB_GRACE_MINUTES = 60  # never sweep blobs younger than this
+
+def _chunks(xs: List, n: int = BATCH):
+    for i in range(0, len(xs), n):
+        yield xs[i:i + n]
+
+def _marks(xs: List) -> str:
+    return ",".join("?" * len(xs))
+
+def old_runs(conn: sqlite3.Connection, keep_days: int) -> List[int]:
+    rows = conn.execute(
+        "SELECT id FROM agent_runs WHERE created_at < datetime('now', ?) ORDER BY id",
+        (f"-{keep_days} days",),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+def archive_runs(conn: sqlite3.Connection, run_ids: List[int], path: Path) -> None:
+    """Append each run with its hydrated tool calls as one JSON line to a gzip archive."""
+    with gzip.open(path, "at", encoding="utf-8") as w:
+        for part in _chunks(run_ids):
+            runs = {r["id"]: dict(r) for r in conn.execute(f"SELECT * FROM agent_runs WHERE id IN ({_marks(part)})", part)}
+            calls = [dict(r) for r in conn.execute(
+                f"SELECT * FROM tool_calls WHERE agent_run_id IN ({_marks(part)}) ORDER BY id", part
+            )]
+            texts = hydrate_json(conn, [c[k] for c in calls for k in ("tool_input_json", "tool_output_json")])
+            for n, c in enumerate(calls):
+                c["tool_input_json"], c["tool_output_json"] = texts[2 * n], texts[2 * n + 1]
+                runs[c["agent_run_id"]].setdefault("tool_calls", []).append(c)
+            for run in runs.values():
+                w.write(json.dumps(run, ensure_ascii=False) + "\n")
+
+def delete_runs(conn: sqlite3.Connection, run_ids: List[int]) -> int:
+    deleted = 0
+    for part in _chunks(run_ids):
+        with conn:
+            deleted += conn.execute(f"DELETE FROM tool_calls WHERE agent_run_id IN ({_marks(part)})", part).rowcount
+            conn.execute(f"DELETE FROM agent_runs WHERE id IN ({_marks(part)})", part)
+    return deleted
+
+def reencode_rows(conn: sqlite3.Connection) -> int:
+    """Move large inline payloads written before blob storage into the blob table."""
+    ids = [r[0] for r in conn.execute(
+        "SELECT id FROM tool_calls WHERE length(tool_input_json) >= ? OR length(tool_output_json) >= ?",
+        (BLOB_MIN_CHARS, BLOB_MIN_CHARS),
+    )]
+    changed = 0
+    for part in _chunks(ids):
+        rows = conn.execute(
+            f"SELECT id, tool_input_json, tool_output_json FROM tool_calls WHERE id IN ({_marks(part)})", part
+        ).fetchall()
+        updates: List[Tuple[str, str, int]] = []
+        blobs = []
+        for rid, inp, out in rows:
+            new = []
+            for text in (inp, out):
+                enc, b = encode_payload(json.loads(text)) if text else (text, [])
+                new.append(enc if len(enc or "") < len(text or "") else text)
+                blobs.extend(b)
+            if new != [inp, out]:
+                updates.append((new[0], new[1], rid))
+        with conn:
+            conn.executemany(INSERT_BLOB_SQL, blobs)
+            conn.executemany("UPDATE tool_calls SET tool_input_json = ?, tool_output_json = ? WHERE id = ?", updates)
+        changed += len(updates)
+    return changed
+
+def sweep_blobs(conn: sqlite3.Connection, grace_minutes: int = BLOB_GRACE_MINUTES) -> Tuple[int, int]:
+    """Delete unreferenced blobs older than the grace period; returns (count, uncompressed bytes).
+
+    The reference scan and the delete run in one write transaction, so the trace writer cannot commit a row
+    pointing at a blob in between; its INSERT OR IGNORE after the commit re-creates anything it needs.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_blobs(hash TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.live_blobs")
+        conn.executemany("INSERT INTO temp.live_blobs(hash) VALUES (?)", ((h,) for h in referenced_hashes(conn)))
+        dead_where = "created_at < datetime('now', ?) AND hash NOT IN (SELECT hash FROM temp.live_blobs)"
+        cutoff = (f"-{grace_minutes} minutes",)
+        n_dead, dead_bytes = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs WHERE {dead_where}", cutoff).fetchone()
+        conn.execute(f"DELETE FROM blobs WHERE {dead_where}", cutoff)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return n_dead, dead_bytes
+
+def db_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in (path, path.with_name(path.name + "-wal")) if p.exists())
+
+def main():
+    ap = argparse.ArgumentParser(description="Prune old agent runs, compact trace payloads and reclaim space in app.db.")
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    ap.add_argument("--keep-days", type=int, default=30, help="delete runs older than this many days")
+    ap.add_argument("--archive", type=Path, help="append pruned runs (with hydrated tool calls) to this .jsonl.gz first")
+    ap.add_argument("--reencode", action="store_true", help="move large inline payloads of kept rows into blobs")
+    ap.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return freed pages to the filesystem")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--grace-minutes", type=int, default=BLOB_GRACE_MINUTES, help="keep unreferenced blobs younger than this")
+    args = ap.parse_args()
+
+    before = db_bytes(args.db)
+    conn = connect(args.db)
+    conn.executescript(BLOB_SCHEMA)
+    runs = old_runs(conn, args.keep_days)
+    print(f"runs older than {args.keep_days} days: {len(runs)}")
+    if args.dry_run:
+        return
+
+    if runs and args.archive:
+        archive_runs(conn, runs, args.archive)
+        print(f"archived to {args.archive}")
+    print(f"tool_calls deleted: {delete_runs(conn, runs)}")
+    if args.reencode:
+        print(f"tool_calls re-encoded: {reencode_rows(conn)}")
+    n_dead, dead_bytes = sweep_blobs(conn, args.grace_minutes)
+    print(f"blobs deleted: {n_dead} ({dead_bytes:,} bytes uncompressed)")
+
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    if args.vacuum:
+        conn.execute("VACUUM")
+    conn.close()
+    print(f"db size: {before:,} -> {db_bytes(args.db):,} bytes")
+
+if __name__ == "__main__":
+    main()
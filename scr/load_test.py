@@ -0,0 +1,90 @@
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import numpy as np
+import requests
+
+API = "http://127.0.0.1:8000"
+BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_local = threading.local()
+
+def _session() -> requests.Session:
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+def fire(url: str, payload: dict, scheduled: float, timeout: float) -> Tuple[float, Optional[str]]:
+    """POST once; latency is measured from the scheduled send time so queueing delay is not hidden."""
+    try:
+        r = _session().post(url, json=payload, timeout=timeout)
+        err = None if r.status_code == 200 else f"HTTP {r.status_code}"
+    except requests.RequestException as e:
+        err = type(e).__name__
+    return (time.perf_counter() - scheduled) * 1000, err
+
+def histogram(lat_ms: List[float]) -> None:
+    counts = np.histogram(lat_ms, bins=(0,) + BUCKETS_MS + (float("inf"),))[0]
+    peak = max(counts.max(), 1)
+    lo = 0
+    for hi, n in zip(BUCKETS_MS + (None,), counts):
+        label = f"{lo}-{hi} ms" if hi is not None else f">{lo} ms"
+        print(f"  {label:>14} {n:>7} {'#' * int(40 * n / peak)}")
+        lo = hi
+
+def main():
+    ap = argparse.ArgumentParser(description="Open-loop load generator for POST /run_agent1.")
+    ap.add_argument("--url", default=API)
+    ap.add_argument("--rps", type=float, default=5.0, help="target request rate")
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds to generate load")
+    ap.add_argument("--tickets", type=int, default=200, help="sample ticket ids from the newest N tickets")
+    ap.add_argument("--max-inflight", type=int, default=256)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--model", help="model name sent to the API (default: the API's default model)")
+    ap.add_argument("--bypass-cache", action="store_true", help="send bypass_cache so every request reaches the LLM backend")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    ids = [t["id"] for t in requests.get(f"{args.url}/tickets", params={"limit": args.tickets}).json()]
+    if not ids:
+        raise SystemExit("no tickets returned by /tickets")
+    rng = random.Random(args.seed)
+    url = f"{args.url}/run_agent1"
+    n = int(args.rps * args.duration)
+    print(f"{n} requests at {args.rps} rps over {args.duration:.0f}s against {url}")
+
+    pool = ThreadPoolExecutor(max_workers=args.max_inflight)
+    futures = []
+    t0 = time.perf_counter()
+    for i in range(n):
+        # Fixed schedule (open loop): a slow server does not slow down the arrival rate.
+        scheduled = t0 + i / args.rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        payload = {"ticket_id": rng.choice(ids), "bypass_cache": args.bypass_cache}
+        if args.model:
+            payload["model"] = args.model
+        futures.append(pool.submit(fire, url, payload, scheduled, args.timeout))
+    sent_s = time.perf_counter() - t0
+    results = [f.result() for f in futures]
+    total_s = time.perf_counter() - t0
+    pool.shutdown()
+
+    ok = [ms for ms, err in results if err is None]
+    errors = Counter(err for _, err in results if err is not None)
+    print(f"\nsent: {n} in {sent_s:.1f}s (offered {n / max(sent_s, 1e-9):.2f} rps)  completed in {total_s:.1f}s")
+    print(f"ok: {len(ok)}  errors: {sum(errors.values())} ({100 * sum(errors.values()) / max(n, 1):.1f}%)  throughput: {len(ok) / max(total_s, 1e-9):.2f} rps")
+    for err, count in errors.most_common():
+        print(f"  {count:>7} x {err}")
+    if ok:
+        p50, p90, p99 = np.percentile(np.asarray(ok), [50, 90, 99])
+        print(f"latency ms: p50 {p50:.0f}  p90 {p90:.0f}  p99 {p99:.0f}  max {max(ok):.0f}")
+        histogram(ok)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import argparse
+import sys
+from pathlib import Path
+from db.aggregates import diff_aggregates, ensure_aggregates, missing_objects, rebuild_aggregates
+from db.conn import DB_PATH, connect
+
+def main():
+    ap = argparse.ArgumentParser(description="Recompute the trigger-maintained ticket summary tables in app.db.")
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    ap.add_argument("--verify", action="store_true", help="only compare the tables with a live aggregation; exit 1 on drift")
+    args = ap.parse_args()
+
+    conn = connect(args.db)
+    missing = missing_objects(conn)
+    if missing:
+        print(f"missing: {', '.join(missing)}")
+        if args.verify:
+            conn.close()
+            sys.exit(1)
+        conn.close()
+        ensure_aggregates(args.db)
+        print("created and filled from db/schema.sql")
+        return
+
+    drift = diff_aggregates(conn)
+    for table, n in drift.items():
+        print(f"{table}: {n} rows differ from live aggregation")
+    if args.verify:
+        conn.close()
+        sys.exit(1 if any(drift.values()) else 0)
+
+    with conn:
+        counts = rebuild_aggregates(conn)
+    for table, n in counts.items():
+        print(f"{table}: rebuilt {n} rows")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
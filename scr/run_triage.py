@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from agt.llm import DEFAULT_GEMINI_MODEL, DEFAULT_OPENAI_MODEL
+from db.conn import get_conn, schema_statements, transaction
+
+TRIAGE_TABLES = ("triage_jobs", "triage_items")
+
+BACKENDS = {
+    "gemini": ("agt.agent1", DEFAULT_GEMINI_MODEL, "GEMINI_API_KEY"),
+    "openai": ("agt.agent", DEFAULT_OPENAI_MODEL, "OPENAI_API_KEY"),
+}
+STAGES = ("context", "rag", "prompt", "cache", "llm", "finish", "total")
+
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` acquisitions per second, bursting up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_s = (1 - self._tokens) / self.rate
+            time.sleep(wait_s)
+
+def select_tickets(filters: Dict[str, Any]) -> List[int]:
+    where, params = [], []
+    for col in ("status", "priority", "category"):
+        if filters.get(col):
+            where.append(f"{col} = ?")
+            params.append(filters[col])
+    if filters.get("since"):
+        where.append("created_at >= ?")
+        params.append(filters["since"])
+    if filters.get("until"):
+        where.append("created_at < ?")
+        params.append(filters["until"])
+    sql = "SELECT id FROM tickets" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id"
+    if filters.get("limit"):
+        sql += f" LIMIT {int(filters['limit'])}"
+    return [r[0] for r in get_conn(readonly=True).execute(sql, params).fetchall()]
+
+def open_job(name: str, filters: Dict[str, Any], retry_failed: bool) -> Tuple[int, List[int]]:
+    """Create the job (snapshotting the matching tickets) or resume it; returns the tickets still to run."""
+    with transaction() as conn:
+        for stmt in schema_statements(TRIAGE_TABLES, if_not_exists=True):
+            conn.execute(stmt)
+    with transaction() as conn:
+        row = conn.execute("SELECT id FROM triage_jobs WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            job_id = conn.execute(
+                "INSERT INTO triage_jobs(name, filters_json) VALUES (?, ?)",
+                (name, json.dumps(filters)),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO triage_items(job_id, ticket_id) VALUES (?, ?)",
+                [(job_id, tid) for tid in select_tickets(filters)],
+            )
+        else:
+            job_id = row[0]
+        states = ("pending", "failed") if retry_failed else ("pending",)
+        todo = conn.execute(
+            f"SELECT ticket_id FROM triage_items WHERE job_id = ? AND status IN ({','.join('?' * len(states))}) ORDER BY ticket_id",
+            (job_id, *states),
+        ).fetchall()
+    return job_id, [r[0] for r in todo]
+
+def record(job_id: int, ticket_id: int, run_id: Optional[int], error: Optional[str], timings: Dict[str, float]) -> None:
+    with transaction() as conn:
+        conn.execute(
+            """
+            UPDATE triage_items
+            SET status = ?, agent_run_id = ?, error = ?, attempts = attempts + 1,
+                timings_json = ?, updated_at = datetime('now')
+            WHERE job_id = ? AND ticket_id = ?
+            """,
+            ("failed" if error else "done", run_id, error, json.dumps(timings), job_id, ticket_id),
+        )
+
+def triage_one(
+    run_agent: Callable, limiter: RateLimiter, ticket_id: int, model: str, use_cache: bool
+) -> Tuple[Optional[int], Optional[str], Dict[str, float]]:
+    limiter.acquire()
+    t0 = time.perf_counter()
+    try:
+        res = run_agent(ticket_id=ticket_id, model=model, use_cache=use_cache)
+        return res.agent_run_id, None, res.timings
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", {"total": (time.perf_counter() - t0) * 1000}
+
+def report(done: int, failed: int, elapsed: float, stage_ms: Dict[str, List[float]], errors: Counter) -> None:
+    n = done + failed
+    print(f"\ntickets: {n} done: {done} failed: {failed} elapsed: {elapsed:.1f}s throughput: {n / max(elapsed, 1e-9):.2f} tickets/s")
+    print(f"{'stage':<10}{'n':>8}{'p50_ms':>12}{'p95_ms':>12}{'p99_ms':>12}")
+    for stage in STAGES:
+        xs = stage_ms.get(stage)
+        if xs:
+            p50, p95, p99 = np.percentile(np.asarray(xs), [50, 95, 99])
+            print(f"{stage:<10}{len(xs):>8}{p50:>12.1f}{p95:>12.1f}{p99:>12.1f}")
+    for err, count in errors.most_common(5):
+        print(f"  {count:>5} x {err[:120]}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the triage agent over a filtered set of tickets.")
+    ap.add_argument("--status")
+    ap.add_argument("--priority")
+    ap.add_argument("--category")
+    ap.add_argument("--since", help="created_at lower bound (inclusive), e.g. 2024-01-01")
+    ap.add_argument("--until", help="created_at upper bound (exclusive)")
+    ap.add_argument("--limit", type=int, default=0)
+    ap.add_argument("--backend", choices=BACKENDS, default="gemini")
+    ap.add_argument("--model")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--rps", type=float, default=2.0, help="max agent calls per second (0 = unlimited)")
+    ap.add_argument("--job", help="checkpoint name; rerun with the same name to resume")
+    ap.add_argument("--retry-failed", action="store_true", help="also rerun items that failed in a previous attempt")
+    ap.add_argument("--no-cache", action="store_true", help="skip the LLM response cache lookup")
+    args = ap.parse_args()
+
+    module, default_model, key_env = BACKENDS[args.backend]
+    if os.environ.get("LLM_BACKEND", args.backend) != "stub" and not os.environ.get(key_env):
+        raise SystemExit(f"Set {key_env} in your environment or .env before running.")
+    run_agent = __import__(module, fromlist=["run_agent"]).run_agent
+    model = args.model or default_model
+
+    filters = {k: getattr(args, k) for k in ("status", "priority", "category", "since", "until", "limit")}
+    name = args.job or f"triage-{time.strftime('%Y%m%d-%H%M%S')}"
+    job_id, todo = open_job(name, filters, args.retry_failed)
+    print(f"job {name!r} (id {job_id}): {len(todo)} tickets to run, {args.workers} workers, {args.rps or 'unlimited'} rps")
+
+    limiter = RateLimiter(args.rps, burst=args.workers)
+    stage_ms: Dict[str, List[float]] = defaultdict(list)
+    errors: Counter = Counter()
+    done = failed = 0
+    t0 = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    inflight: Dict[Any, int] = {}
+    queue = iter(todo)
+    try:
+        while True:
+            # Keep a bounded window of submissions so an interrupt leaves most items pending.
+            while len(inflight) < args.workers * 2:
+                tid = next(queue, None)
+                if tid is None:
+                    break
+                inflight[pool.submit(triage_one, run_agent, limiter, tid, model, not args.no_cache)] = tid
+            if not inflight:
+                break
+            finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                tid = inflight.pop(fut)
+                run_id, error, timings = fut.result()
+                record(job_id, tid, run_id, error, timings)
+                for stage, ms in timings.items():
+                    stage_ms[stage].append(ms)
+                if error:
+                    failed += 1
+                    errors[error] += 1
+                else:
+                    done += 1
+    except KeyboardInterrupt:
+        print(f"\ninterrupted; rerun with --job {name} to resume")
+        for fut in inflight:
+            fut.cancel()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        report(done, failed, time.perf_counter() - t0, stage_ms, errors)
+
+if __name__ == "__main__":
+    main()
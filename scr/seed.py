@@ -1,86 +1,242 @@
-import sqlite3
-import pandas as pd
+import argparse
+import json
 import random
-import re
-from pathlib import Path
+import sqlite3
+import time
 from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+import pandas as pd
+from db.aggregates import rebuild_aggregates
 
 DB_PATH = Path("db/app.db")
 SCHEMA_SQL = Path("db/schema.sql")
 TICKETS_CSV = Path("dat/raw/tickets_clean.csv")
 
-PRODUCT_NAMES = [
-    "Laptop Pro X",
-    "Phone Max 12",
-    "Earbuds Air",
-    "Router WiFi 6",
-    "Smartwatch Fit",
-    "Tablet Plus",
-]
+CHUNK_ROWS = 20_000      # CSV rows parsed per pandas chunk
+BATCH_ROWS = 5_000       # rows per executemany
+COMMIT_ROWS = 200_000    # tickets per transaction
+
+# Relaxed durability for a throwaway bulk load; restored to the app's settings (db/conn.py) afterwards.
+LOAD_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "foreign_keys": "OFF",
+    "temp_store": "MEMORY",
+    "cache_size": -512_000,
+    "locking_mode": "EXCLUSIVE",
+}
+
+CSV_COLUMNS = {
+    "Customer Name": "name",
+    "Customer Email": "email",
+    "Product Purchased": "product",
+    "Date of Purchase": "purchased",
+    "Ticket Type": "category",
+    "Ticket Subject": "subject",
+    "Ticket Description": "body",
+    "Ticket Status": "status",
+    "Ticket Priority": "priority",
+    "Ticket Channel": "channel",
+}
+STATUS_MAP = {"Open": "open", "Closed": "closed", "Pending Customer Response": "pending"}
+PRIORITY_MAP = {"Low": "low", "Medium": "normal", "High": "high", "Critical": "urgent"}
+ORDER_STATUSES = ["delivered"] * 6 + ["shipped"] * 2 + ["refunded"]
+TIERS = ["standard"] * 3 + ["premium"]
+CUSTOMER_SKEW = 1.5      # synthetic tickets pick customers as u**skew: a few customers file many tickets
+EXTRA_ORDER_RATE = 0.6   # orders per ticket beyond the purchase the ticket is about
+
+def init_db(conn: sqlite3.Connection) -> List[str]:
+    """Create the schema, then drop its indexes and triggers for the load; returns their SQL to recreate."""
+    conn.executescript(SCHEMA_SQL.read_text(encoding="utf-8"))
+    deferred = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL ORDER BY type"
+    ).fetchall()
+    for kind, name, _ in deferred:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    return [sql for _, _, sql in deferred]
+
+def count_csv_rows(path: Path) -> int:
+    return sum(len(c) for c in pd.read_csv(path, usecols=[0], chunksize=CHUNK_ROWS))
+
+def iter_csv(path: Path) -> Iterator[Tuple[str, ...]]:
+    """CSV rows as tuples in CSV_COLUMNS order, parsed CHUNK_ROWS at a time."""
+    for chunk in pd.read_csv(path, usecols=list(CSV_COLUMNS), dtype=str, keep_default_na=False, chunksize=CHUNK_ROWS):
+        yield from chunk[list(CSV_COLUMNS)].itertuples(index=False, name=None)
+
+class Loader:
+    """Buffers rows per table with explicit ids and flushes them with executemany."""
+
+    SQL = {
+        "customers": "INSERT INTO customers(id, name, email, tier, created_at) VALUES (?, ?, ?, ?, ?)",
+        "products": "INSERT INTO products(id, name, category) VALUES (?, ?, ?)",
+        "orders": "INSERT INTO orders(id, customer_id, product_id, status, total, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        "tickets": "INSERT INTO tickets(id, customer_id, subject, body, status, priority, category, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        "ticket_events": "INSERT INTO ticket_events(ticket_id, event_type, payload_json, created_at) VALUES (?, ?, ?, ?)",
+    }
+
+    def __init__(self, conn: sqlite3.Connection, seed: int):
+        self.conn = conn
+        self.rng = random.Random(seed)
+        self.rows: Dict[str, List[tuple]] = {t: [] for t in self.SQL}
+        self.counts: Dict[str, int] = {t: 0 for t in self.SQL}
+        self.customers: Dict[str, int] = {}
+        self.products: Dict[str, int] = {}
+        self.prices: Dict[int, float] = {}
+        self.n_customers = 0
+        self.n_orders = 0
+        self.n_tickets = 0
+
+    def add(self, table: str, row: tuple) -> None:
+        buf = self.rows[table]
+        buf.append(row)
+        if len(buf) >= BATCH_ROWS:
+            self.flush(table)
+
+    def flush(self, table: str = "") -> None:
+        for t in [table] if table else self.SQL:
+            if self.rows[t]:
+                self.conn.executemany(self.SQL[t], self.rows[t])
+                self.counts[t] += len(self.rows[t])
+                self.rows[t].clear()
 
-def init_db(conn: sqlite3.Connection) -> None:
-    sql = SCHEMA_SQL.read_text(encoding="utf-8")
-    conn.executescript(sql)
-    conn.commit()
+    def commit(self) -> None:
+        self.flush()
+        self.conn.commit()
+
+    def customer(self, name: str, email: str, since: datetime) -> int:
+        cid = self.customers.get(email)
+        if cid is None:
+            self.n_customers += 1
+            cid = self.customers[email] = self.n_customers
+            self.add("customers", (cid, name, email, self.rng.choice(TIERS), _ts(since - timedelta(days=self.rng.randint(0, 720)))))
+        return cid
+
+    def synthetic_customers(self, n: int) -> None:
+        start = self.n_customers
+        for cid in range(start + 1, start + n + 1):
+            since = datetime(2019, 1, 1) + timedelta(days=self.rng.randint(0, 1090))
+            self.add("customers", (cid, f"Customer {cid}", f"customer{cid}@example.com", self.rng.choice(TIERS), _ts(since)))
+        self.n_customers += n
+
+    def product(self, name: str) -> int:
+        pid = self.products.get(name)
+        if pid is None:
+            pid = self.products[name] = len(self.products) + 1
+            self.prices[pid] = round(self.rng.uniform(29, 1999), 2)
+            self.add("products", (pid, name, name.split()[0].lower()))
+        return pid
+
+    def order(self, cid: int, pid: int, when: datetime) -> None:
+        self.n_orders += 1
+        total = round(self.prices[pid] * self.rng.uniform(0.9, 1.1), 2)
+        self.add("orders", (self.n_orders, cid, pid, self.rng.choice(ORDER_STATUSES), total, _ts(when)))
+
+    def ticket(self, cid: int, product: str, purchased: datetime, row: Tuple[str, ...]) -> None:
+        _, _, _, _, category, subject, body, status, priority, channel = row
+        rng = self.rng
+        pid = self.product(product)
+        self.order(cid, pid, purchased)
+        if rng.random() < EXTRA_ORDER_RATE:
+            self.order(cid, rng.randint(1, len(self.products)), purchased - timedelta(days=rng.randint(1, 400)))
+
+        self.n_tickets += 1
+        tid = self.n_tickets
+        created = purchased + timedelta(days=rng.randint(0, 60), seconds=rng.randint(0, 86399))
+        status = STATUS_MAP.get(status, "open")
+        self.add("tickets", (
+            tid, cid, subject, body.replace("{product_purchased}", product), status,
+            PRIORITY_MAP.get(priority, "normal"), category, _ts(created),
+        ))
+        self.add("ticket_events", (tid, "CREATED", json.dumps({"channel": channel}), _ts(created)))
+        if status != "open":
+            later = created + timedelta(hours=rng.expovariate(1 / 20))
+            self.add("ticket_events", (tid, "STATUS_CHANGE", json.dumps({"to": status}), _ts(later)))
+
+def _ts(d: datetime) -> str:
+    return d.strftime("%Y-%m-%d %H:%M:%S")
+
+def _date(s: str, rng: random.Random) -> datetime:
+    try:
+        return datetime.strptime(s, "%Y-%m-%d")
+    except ValueError:
+        return datetime(2020, 1, 1) + timedelta(days=rng.randint(0, 729))
+
+def load(conn: sqlite3.Connection, csv_path: Path, scale: float, seed: int) -> Loader:
+    """Stream the CSV into the database, then keep re-streaming it as templates for synthetic tickets until
+    scale * (CSV rows) tickets exist. Synthetic tickets get new customers (scale * CSV customers in total),
+    a random product and a shifted purchase date; status, priority, category and text keep the CSV's mix."""
+    csv_rows = count_csv_rows(csv_path)
+    target = max(1, round(csv_rows * scale))
+    ld = Loader(conn, seed)
+    rng = ld.rng
+    started = time.perf_counter()
+
+    def progress() -> None:
+        if ld.n_tickets % COMMIT_ROWS == 0:
+            ld.commit()
+            rate = ld.n_tickets / (time.perf_counter() - started)
+            print(f"  {ld.n_tickets:,}/{target:,} tickets ({rate:,.0f}/s)")
+
+    for row in iter_csv(csv_path):
+        if ld.n_tickets >= target:
+            break
+        purchased = _date(row[3], rng)
+        cid = ld.customer(row[0], row[1].strip().lower(), purchased)
+        ld.ticket(cid, row[2], purchased, row)
+        progress()
+
+    if ld.n_tickets < target:
+        ld.flush("customers")
+        ld.synthetic_customers(max(0, round(len(ld.customers) * scale) - ld.n_customers))
+        products = list(ld.products)
+        while ld.n_tickets < target:
+            for row in iter_csv(csv_path):
+                if ld.n_tickets >= target:
+                    break
+                cid = 1 + int(ld.n_customers * rng.random() ** CUSTOMER_SKEW)
+                purchased = _date(row[3], rng) + timedelta(days=rng.randint(-180, 180))
+                ld.ticket(cid, rng.choice(products), purchased, row)
+                progress()
+    ld.commit()
+    return ld
+
+def finalize(conn: sqlite3.Connection, deferred: List[str]) -> None:
+    """Indexes and triggers back, FTS and summary tables built in one pass, then the app's journal settings."""
+    with conn:
+        for sql in deferred:
+            conn.execute(sql)
+        conn.execute("INSERT INTO tickets_fts(tickets_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO tickets_fts(tickets_fts) VALUES ('optimize')")
+        rebuild_aggregates(conn)
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA locking_mode = NORMAL")
+    conn.execute("PRAGMA journal_mode = WAL")
 
 def main():
-    df = pd.read_csv(TICKETS_CSV)
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    init_db(conn)
-
-    products = [(p, p.split()[0].lower()) for p in PRODUCT_NAMES]
-    cur.executemany("INSERT INTO products(name, category) VALUES (?, ?)", products)
-
-    customers = []
-    seen_email = set()
-    for i, row in df.head(400).iterrows():
-        name = str(row.get("customer_name", f"Customer {i+1}"))
-        email = str(row.get("customer_email", f"user{i+1}@example.com")).strip().lower()
-        if email not in seen_email:
-            seen_email.add(email)
-            tier = random.choice(["standard", "standard", "standard", "premium"])
-            customers.append((name, email, tier))
-
-    cur.executemany("INSERT OR IGNORE INTO customers(name, email, tier) VALUES (?, ?, ?)", customers)
-    conn.commit()
-
-    cust_map = {r[1]: r[0] for r in cur.execute("SELECT id, email FROM customers").fetchall()}
-    product_ids = [r[0] for r in cur.execute("SELECT id FROM products").fetchall()]
-    customer_ids = [r[0] for r in cur.execute("SELECT id FROM customers").fetchall()]
-
-    orders = []
-    base_date = datetime.now() - timedelta(days=365)
-    for oid in range(1, min(800, len(customer_ids) * 3) + 1):
-        cid = random.choice(customer_ids)
-        pid = random.choice(product_ids)
-        status = random.choice(["delivered", "delivered", "delivered", "shipped", "refunded"])
-        total = round(random.uniform(29, 1999), 2)
-        created_at = (base_date + timedelta(days=random.randint(0, 360))).strftime("%Y-%m-%d %H:%M:%S")
-        orders.append((oid, cid, pid, status, total, created_at))
-
-    cur.executemany("INSERT OR REPLACE INTO orders(id, customer_id, product_id, status, total, created_at) VALUES (?, ?, ?, ?, ?, ?)", orders)
-    conn.commit()
-
-    tickets = []
-    for _, row in df.head(800).iterrows():
-        product_name = random.choice(PRODUCT_NAMES)
-        body = str(row.get("body", ""))
-        subject = str(row.get("subject", f"Issue with {product_name}"))
-        category = str(row.get("category", "General"))
-        priority = str(row.get("priority", "normal")).lower()
-        status = str(row.get("status", "open")).lower()
-        customer_id = cust_map.get(str(row.get("customer_email", "")).strip().lower()) or random.choice(customer_ids)
-        created_at = (base_date + timedelta(days=random.randint(0, 360))).strftime("%Y-%m-%d %H:%M:%S")
-        tickets.append((customer_id, subject, body, status, priority, category, created_at))
-
-    cur.executemany("INSERT INTO tickets(customer_id, subject, body, status, priority, category, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)", tickets)
-    cur.execute("INSERT INTO ticket_events(ticket_id, event_type, payload_json) VALUES (1,'CREATED','{\"by\":\"seed\"}')")
-    cur.execute("INSERT INTO ticket_events(ticket_id, event_type, payload_json) VALUES (1,'TAGGED','{\"tag\":\"battery\"}')")
-    conn.commit()
+    ap = argparse.ArgumentParser(description="Create db/app.db from db/schema.sql and the ticket CSV, optionally scaled up.")
+    ap.add_argument("--db", type=Path, default=DB_PATH)
+    ap.add_argument("--csv", type=Path, default=TICKETS_CSV)
+    ap.add_argument("--scale", type=float, default=1.0,
+                    help="tickets and customers relative to the CSV: 0.1 for a small demo db, 120 for ~1M tickets")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    args.db.parent.mkdir(parents=True, exist_ok=True)
+    for p in (args.db, args.db.with_name(args.db.name + "-wal"), args.db.with_name(args.db.name + "-shm")):
+        p.unlink(missing_ok=True)
+    conn = sqlite3.connect(args.db)
+
+    t0 = time.perf_counter()
+    deferred = init_db(conn)
+    for k, v in LOAD_PRAGMAS.items():  # after the schema script, which turns foreign keys on
+        conn.execute(f"PRAGMA {k} = {v}")
+    ld = load(conn, args.csv, args.scale, args.seed)
+    t1 = time.perf_counter()
+    print(f"loaded in {t1 - t0:.1f}s: " + ", ".join(f"{n:,} {t}" for t, n in ld.counts.items()))
+    finalize(conn, deferred)
     conn.close()
+    print(f"indexes, triggers, FTS and summary tables in {time.perf_counter() - t1:.1f}s -> {args.db}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,100 @@
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from scr import compact_traces
+from db.blobs import INSERT_BLOB_SQL, REF_RE, encode_payload
+from db.conn import connect
+
+SCHEMA_SQL = Path("db/schema.sql")
+
+def build_db(path: Path) -> None:
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA_SQL.read_text(encoding="utf-8"))
+    conn.execute("INSERT INTO agent_runs(id, input_text) VALUES (1, 'sweep test')")
+    conn.commit()
+    conn.close()
+
+def add_old_blob(path: Path, payload: dict) -> str:
+    """An unreferenced blob old enough to be swept; returns the tool_calls JSON that would reference it."""
+    text, blobs = encode_payload(payload)
+    conn = connect(path)
+    with conn:
+        conn.executemany(INSERT_BLOB_SQL, blobs)
+        conn.execute("UPDATE blobs SET created_at = datetime('now', '-1 day')")
+    conn.close()
+    return text
+
+def write_trace_row(path: Path, payload: dict) -> None:
+    """What the trace writer commits for one tool call: its blobs, then the row."""
+    text, blobs = encode_payload(payload)
+    conn = connect(path)
+    with conn:
+        conn.executemany(INSERT_BLOB_SQL, blobs)
+        conn.execute(
+            "INSERT INTO tool_calls(agent_run_id, tool_name, tool_input_json, tool_output_json) VALUES (1, 'rag_search', '{}', ?)",
+            (text,),
+        )
+    conn.close()
+
+def dangling_refs(path: Path) -> int:
+    conn = connect(path)
+    refs = {h for (out,) in conn.execute("SELECT tool_output_json FROM tool_calls") for h in REF_RE.findall(out or "")}
+    have = {h for (h,) in conn.execute("SELECT hash FROM blobs")}
+    conn.close()
+    return len(refs - have)
+
+def check_concurrent_reference(path: Path) -> int:
+    """A trace row referencing an old unreferenced blob is written between the reference scan and the delete."""
+    payload = {"hits": [{"text": "refund policy " * 200}]}
+    add_old_blob(path, payload)
+    writer = threading.Thread(target=write_trace_row, args=(path, payload))
+    scan = compact_traces.referenced_hashes
+
+    def scan_then_write(conn):
+        live = scan(conn)
+        writer.start()
+        time.sleep(0.3)  # the writer commits here unless the sweep holds the write lock
+        return live
+
+    compact_traces.referenced_hashes = scan_then_write
+    try:
+        conn = connect(path)
+        n_dead, _ = compact_traces.sweep_blobs(conn)
+        conn.close()
+    finally:
+        compact_traces.referenced_hashes = scan
+    writer.join()
+    missing = dangling_refs(path)
+    print(f"concurrent reference: swept {n_dead}, dangling refs {missing}")
+    return missing
+
+def check_grace_period(path: Path) -> int:
+    """A fresh unreferenced blob survives the sweep; an old one does not."""
+    old, _ = encode_payload({"text": "old " * 300})
+    fresh, blobs = encode_payload({"text": "fresh " * 300})
+    add_old_blob(path, {"text": "old " * 300})
+    conn = connect(path)
+    with conn:
+        conn.executemany(INSERT_BLOB_SQL, blobs)
+    n_dead, _ = compact_traces.sweep_blobs(conn)
+    left = {h for (h,) in conn.execute("SELECT hash FROM blobs")}
+    conn.close()
+    bad = int(not set(REF_RE.findall(fresh)) <= left) + int(bool(set(REF_RE.findall(old)) & left))
+    print(f"grace period: swept {n_dead}, wrong {bad}")
+    return bad
+
+def main():
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, check in enumerate((check_concurrent_reference, check_grace_period)):
+            path = Path(tmp) / f"sweep{n}.db"
+            build_db(path)
+            failures += check(path)
+    print("FAIL" if failures else "ok")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
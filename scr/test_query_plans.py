@@ -0,0 +1,200 @@
+import argparse
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from starlette.requests import Request
+import db.conn
+from db import sql_tool
+from db.blobs import INSERT_BLOB_SQL, encode_payload
+from db.logging import set_sync_mode
+
+SCHEMA_SQL = Path("db/schema.sql")
+
+PRODUCTS = ["Laptop Pro X", "Phone Max 12", "Earbuds Air", "Router WiFi 6", "Smartwatch Fit", "Tablet Plus"]
+WORDS = (
+    "battery charger screen refund warranty replacement shipping delayed broken cracked "
+    "connection wifi bluetooth pairing update firmware account password invoice order "
+    "return damaged missing speaker microphone camera overheating slow crash"
+).split()
+STATUSES = ["open", "open", "pending", "closed"]
+PRIORITIES = ["low", "normal", "normal", "high", "urgent"]
+CATEGORIES = ["Technical issue", "Billing inquiry", "Refund request", "Product inquiry", "Cancellation request"]
+
+# Plan lines accepted for a scenario, with the reason they are inherent to the query.
+ALLOWED: Dict[str, List[Tuple[str, str]]] = {
+    "ticket_dashboard_top_categories": [
+        (r"SCAN category_ticket_stats", "one row per category, maintained by triggers"),
+        (r"USE TEMP B-TREE FOR ORDER BY", "orders the categories by count"),
+    ],
+    "similar_tickets_by_keywords": [(r"USE TEMP B-TREE FOR ORDER BY", "ranks the FTS matches by bm25")],
+    "load_ticket_context": [(r"USE TEMP B-TREE FOR ORDER BY", "ranks the FTS matches by bm25")],
+}
+
+def _date(rng: random.Random) -> str:
+    return f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+
+def build_db(path: Path, n_tickets: int, seed: int = 0) -> None:
+    """Fresh database from db/schema.sql filled with synthetic rows at a realistic ratio to n_tickets."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA_SQL.read_text(encoding="utf-8"))
+    n_customers = max(50, n_tickets // 6)
+    with conn:
+        conn.executemany("INSERT INTO products(name, category) VALUES (?, ?)", [(p, p.split()[0].lower()) for p in PRODUCTS])
+        conn.executemany(
+            "INSERT INTO customers(id, name, email, tier) VALUES (?, ?, ?, ?)",
+            [(i, f"Customer {i}", f"user{i}@example.com", rng.choice(["standard"] * 3 + ["premium"])) for i in range(1, n_customers + 1)],
+        )
+        conn.executemany(
+            "INSERT INTO orders(customer_id, product_id, status, total, created_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (rng.randint(1, n_customers), rng.randint(1, len(PRODUCTS)), rng.choice(["delivered", "shipped", "refunded"]),
+                 round(rng.uniform(29, 1999), 2), _date(rng))
+                for _ in range(2 * n_tickets)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO tickets(customer_id, subject, body, status, priority, category, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (rng.randint(1, n_customers), f"Issue with {rng.choice(PRODUCTS)}", " ".join(rng.choices(WORDS, k=40)),
+                 rng.choice(STATUSES), rng.choice(PRIORITIES), rng.choice(CATEGORIES), _date(rng))
+                for _ in range(n_tickets)
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO ticket_events(ticket_id, event_type, payload_json) VALUES (?, ?, ?)",
+            [(rng.randint(1, n_tickets), "STATUS_CHANGE", "{}") for _ in range(n_tickets)],
+        )
+        n_runs = max(10, n_tickets // 10)
+        conn.executemany(
+            "INSERT INTO agent_runs(ticket_id, input_text, final_answer) VALUES (?, ?, ?)",
+            [(rng.randint(1, n_tickets), "issue", "reply") for _ in range(n_runs)],
+        )
+        for run_id in range(1, n_runs + 1):
+            for tool in ("get_ticket_context", "rag_search", "prompt_assembly", "llm_generate"):
+                out, blobs = encode_payload({"text": " ".join(rng.choices(WORDS, k=200))})
+                conn.executemany(INSERT_BLOB_SQL, blobs)
+                conn.execute(
+                    "INSERT INTO tool_calls(agent_run_id, tool_name, tool_input_json, tool_output_json, duration_ms) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, tool, "{}", out, rng.uniform(1, 500)),
+                )
+    conn.close()
+
+def scenarios(conn: sqlite3.Connection) -> List[Tuple[str, Callable[[], object]]]:
+    """Every SQL path in db/sql_tool.py and the read endpoints of app/api.py, with representative arguments."""
+    from app import api
+
+    tid, cid = conn.execute("SELECT id, customer_id FROM tickets ORDER BY id DESC LIMIT 1").fetchone()
+    run_id = conn.execute("SELECT max(agent_run_id) FROM tool_calls").fetchone()[0]
+    n = conn.execute("SELECT max(id) FROM tickets").fetchone()[0]
+    req = Request({"type": "http", "headers": []})
+
+    def page(**kw):
+        args = {"limit": 50, "cursor": None, "status": None, "priority": None, "category": None, "tier": None, **kw}
+        return api.list_tickets(req, **args)
+
+    _, second = sql_tool.list_tickets_page(limit=50)
+    return [
+        ("get_ticket", lambda: sql_tool.get_ticket(tid)),
+        ("get_customer_recent_orders", lambda: sql_tool.get_customer_recent_orders(cid)),
+        ("get_customer_ticket_stats", lambda: sql_tool.get_customer_ticket_stats(cid)),
+        ("similar_tickets_by_keywords", lambda: sql_tool.similar_tickets_by_keywords(tid)),
+        ("load_ticket_context", lambda: sql_tool.load_ticket_context(tid)),
+        ("get_tickets_by_ids", lambda: sql_tool.get_tickets_by_ids([1, n // 2, n])),
+        ("iter_ticket_texts", lambda: next(sql_tool.iter_ticket_texts(after_id=n // 2))),
+        ("ticket_dashboard_top_categories", lambda: sql_tool.ticket_dashboard_top_categories()),
+        ("insert_ticket_event", lambda: sql_tool.insert_ticket_event(tid, "NOTE", {"by": "plan-check"})),
+        ("GET /tickets", lambda: page()),
+        ("GET /tickets?cursor", lambda: page(cursor=second)),
+        ("GET /tickets?status", lambda: page(status="open")),
+        ("GET /tickets?priority", lambda: page(priority="urgent")),
+        ("GET /tickets?category", lambda: page(category=CATEGORIES[0])),
+        ("GET /tickets?tier", lambda: page(tier="premium")),
+        ("GET /tickets?status&priority&tier", lambda: page(status="pending", priority="high", tier="premium", cursor=second)),
+        ("GET /tickets/{id}", lambda: api.get_ticket(tid)),
+        ("GET /runs/{id}/tool_calls", lambda: api.get_tool_calls(run_id)),
+    ]
+
+def capture(fn: Callable[[], object]) -> List[str]:
+    """Statements (with bound values inlined) that fn runs on this thread's pooled connections."""
+    seen: List[str] = []
+
+    def trace(sql: str) -> None:
+        # FTS5 reads its own shadow tables ('main'.'tickets_fts_config', ...); those are not ours to index.
+        if re.match(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", sql, re.I) and "'main'." not in sql:
+            seen.append(sql.strip())
+
+    conns = [db.conn.get_conn(readonly=True), db.conn.get_conn()]
+    for c in conns:
+        c.set_trace_callback(trace)
+    try:
+        fn()
+    finally:
+        for c in conns:
+            c.set_trace_callback(None)
+    return list(dict.fromkeys(seen))
+
+def plan_problems(details: List[str]) -> List[str]:
+    """Full scans of stored tables and temp B-tree sorts; scans of materialized subqueries and FTS tables are fine."""
+    derived = {d.split()[-1] for d in details if d.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+    bad = []
+    for d in details:
+        m = re.match(r"SCAN (\S+)(.*)", d)
+        if "TEMP B-TREE" in d:
+            bad.append(d)
+        elif m and m.group(1) not in derived and m.group(1) != "CONSTANT" and "VIRTUAL TABLE" not in m.group(2):
+            bad.append(d)
+    return bad
+
+def check_index_set(conn: sqlite3.Connection) -> List[str]:
+    have = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")}
+    want = set(re.findall(r"CREATE INDEX IF NOT EXISTS (\w+)", sql_tool.INDEXES))
+    errors = [f"db/schema.sql is missing index {name} (declared in sql_tool.INDEXES)" for name in sorted(want - have)]
+    errors += [f"db/schema.sql still creates superseded index {name}" for name in sql_tool.SUPERSEDED_INDEXES if name in have]
+    return errors
+
+def main():
+    ap = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN every query in db/sql_tool.py and app/api.py against a scaled database.")
+    ap.add_argument("--tickets", type=int, default=30000, help="scale of the synthetic database")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--verbose", action="store_true", help="print every plan, not only failing ones")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "plans.db"
+        print(f"building {path} with {args.tickets:,} tickets ...")
+        build_db(path, args.tickets, args.seed)
+        db.conn.DB_PATH = path
+        set_sync_mode(True)
+
+        failures = check_index_set(db.conn.get_conn(readonly=True))
+        for msg in failures:
+            print(f"FAIL  {msg}")
+        checked = 0
+        for label, fn in scenarios(db.conn.get_conn(readonly=True)):
+            allowed = ALLOWED.get(label, [])
+            for sql in capture(fn):
+                rows = db.conn.get_conn(readonly=True).execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+                details = [r[3] for r in rows]
+                problems = plan_problems(details)
+                reasons = {d: next((why for p, why in allowed if re.search(p, d)), None) for d in problems}
+                bad = [d for d in problems if reasons[d] is None]
+                checked += 1
+                if bad or args.verbose:
+                    print(f"{'FAIL' if bad else 'ok  '}  {label}: {' '.join(sql.split())[:140]}")
+                    for d in details:
+                        note = f"  (allowed: {reasons[d]})" if reasons.get(d) else ""
+                        print(f"        {'!! ' if d in bad else '   '}{d}{note}")
+                if bad:
+                    failures.append(label)
+        db.conn.close_all()
+
+    print(f"{checked} statements checked, {len(failures)} problems")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
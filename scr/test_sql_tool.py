@@ -22,7 +22,7 @@ def main():
         for o in get_customer_recent_orders(cid, n=5):
             print(" ", o)
 
-    print("\nSIMILAR TICKETS (keyword LIKE):")
+    print("\nSIMILAR TICKETS (FTS5 / BM25):")
     for s in similar_tickets_by_keywords(tid, k=5):
         print(" ", s["id"], s.get("category"), s.get("priority"), s["preview"])
 
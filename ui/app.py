@@ -4,6 +4,29 @@ import streamlit as st
 
 API = "http://127.0.0.1:8000"
 
+def sse_events(resp):
+    event, data = None, []
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line:
+            if event:
+                yield event, json.loads("\n".join(data))
+            event, data = None, []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+def fetch_tickets(params):
+    """One /tickets page; revalidates with If-None-Match so an unchanged page is not sent again."""
+    key = json.dumps(params, sort_keys=True)
+    cache = st.session_state.setdefault("ticket_pages", {})
+    headers = {"If-None-Match": cache[key][0]} if key in cache else {}
+    resp = requests.get(f"{API}/tickets", params={k: v for k, v in params.items() if v is not None}, headers=headers)
+    if resp.status_code != 304:
+        resp.raise_for_status()
+        cache[key] = (resp.headers.get("ETag", ""), resp.json(), resp.headers.get("X-Next-Cursor"))
+    return cache[key][1], cache[key][2]
+
 st.set_page_config(page_title="OpsCopilot", layout="wide")
 st.title("OpsCopilot — Agentic SQL + RAG Support Assistant")
 
@@ -11,8 +34,30 @@ colL, colR = st.columns([1, 2])
 
 with colL:
     st.subheader("Tickets")
-    limit = st.slider("Load tickets", 10, 200, 50, 10)
-    tickets = requests.get(f"{API}/tickets", params={"limit": limit}).json()
+    f1, f2 = st.columns(2)
+    filters = {
+        "status": f1.selectbox("Status", ["", "open", "pending", "closed"]),
+        "priority": f2.selectbox("Priority", ["", "low", "normal", "high", "urgent"]),
+        "tier": f1.selectbox("Tier", ["", "standard", "premium"]),
+        "limit": f2.selectbox("Page size", [25, 50, 100, 200], index=1),
+    }
+    params = {k: v for k, v in filters.items() if v}
+    # Cursors of the pages before the current one; reset whenever the filters change.
+    if st.session_state.get("ticket_filters") != params:
+        st.session_state.ticket_filters = params
+        st.session_state.cursors = [None]
+    tickets, next_cursor = fetch_tickets({**params, "cursor": st.session_state.cursors[-1]})
+    p1, p2, p3 = st.columns([1, 1, 2])
+    if p1.button("Newer", disabled=len(st.session_state.cursors) == 1):
+        st.session_state.cursors.pop()
+        st.rerun()
+    if p2.button("Older", disabled=next_cursor is None):
+        st.session_state.cursors.append(next_cursor)
+        st.rerun()
+    p3.caption(f"Page {len(st.session_state.cursors)}")
+    if not tickets:
+        st.info("No tickets match these filters.")
+        st.stop()
 
     ticket_labels = [
         f"#{t['id']} | {t.get('status')} | {t.get('priority')} | {t.get('customer_tier')} | {t.get('subject')}"
@@ -21,8 +66,9 @@ with colL:
     idx = st.selectbox("Select a ticket", range(len(tickets)), format_func=lambda i: ticket_labels[i])
     ticket_id = tickets[idx]["id"]
 
-    model = st.text_input("Model", value="gemini-2.5-flash")
+    model = st.text_input("Model", value="", placeholder="server default", help="leave empty for the API's default model")
     free_text = st.text_area("Or test with free text (optional)", height=140)
+    bypass_cache = st.checkbox("Bypass LLM cache", value=False)
     run_btn = st.button("Run Agent", type="primary")
 
 with colR:
@@ -41,22 +87,49 @@ with colR:
     st.write(t.get("body", ""))
 
     if run_btn:
-        with st.spinner("Running agent..."):
-            payload = {"model": model}
-            if free_text.strip():
-                payload["free_text"] = free_text.strip()
-            else:
-                payload["ticket_id"] = ticket_id
+        payload = {"bypass_cache": bypass_cache}
+        if model.strip():
+            payload["model"] = model.strip()
+        if free_text.strip():
+            payload["free_text"] = free_text.strip()
+        else:
+            payload["ticket_id"] = ticket_id
 
-            resp = requests.post(f"{API}/run_agent1", json=payload)
-            out = resp.json()
+        status = st.status("Running agent...", expanded=True)
+        st.markdown("## Customer Reply")
+        reply_box = st.empty()
+        reply = ""
+        out = None
+        with requests.post(f"{API}/run_agent1/stream", json=payload, stream=True) as resp:
+            for event, data in sse_events(resp):
+                if event == "context":
+                    status.write(
+                        f"Context loaded: {data['customer_tier'] or 'no'} tier, "
+                        f"{data['recent_orders']} recent orders, {data['similar_tickets']} similar tickets"
+                    )
+                elif event == "rag":
+                    status.write("Policy hits: " + (", ".join(h["cite"] for h in data["hits"]) or "none"))
+                elif event == "llm_start":
+                    status.update(label="Reusing cached reply..." if data["cached"] else f"Generating reply ({data['model']})...")
+                elif event == "reply_delta":
+                    reply += data["text"]
+                    reply_box.markdown(reply)
+                elif event == "done":
+                    out = data
+                elif event == "error":
+                    status.update(label="Agent run failed", state="error")
+                    st.error(data["detail"])
+                    st.stop()
+
+        if out is None:
+            status.update(label="Agent run interrupted", state="error")
+            st.stop()
 
         agent_run_id = out["agent_run_id"]
         result = out["result"]
 
-        st.success(f"Agent run complete: {agent_run_id}")
-        st.markdown("## Customer Reply")
-        st.write(result.get("customer_reply", ""))
+        status.update(label=f"Agent run complete: {agent_run_id}", state="complete", expanded=False)
+        reply_box.write(result.get("customer_reply", ""))
         st.markdown("## Recommended Actions")
         st.write(result.get("recommended_actions", []))
         st.markdown("## Citations")
@@ -68,7 +141,8 @@ with colR:
         calls = requests.get(f"{API}/runs/{agent_run_id}/tool_calls").json()
 
         for c in calls:
-            with st.expander(f"{c['id']} — {c['tool_name']} — {c['created_at']}"):
+            took = f" — {c['duration_ms']:.0f} ms" if c.get("duration_ms") is not None else ""
+            with st.expander(f"{c['id']} — {c['tool_name']} — {c['created_at']}{took}"):
                 tool_input = json.loads(c["tool_input_json"])
                 tool_output = json.loads(c["tool_output_json"])
 